@@ -0,0 +1,341 @@
+import argparse
+import json
+import os
+import random
+import re
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from compression import supported_encodings
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Load test for the blog routes against a seeded local database, with Microsoft Graph replaced
+# by graph_stub.py. Drives the app in-process (Flask test client) and/or through gunicorn.
+# Every route runs logged in; the read routes run again for anonymous visitors (ANONYMOUS_ROUTES).
+#   python bench_routes.py --mode both --posts 500 --requests 300 --output bench_results.json
+#   python bench_routes.py --mode both --output after.json --baseline bench_results.json
+# The default database is a throwaway SQLite file; pass --database-url and --reset to seed
+# another (its tables are dropped and recreated).
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CSRF_PATTERN = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+PASSWORD = 'benchmark-password'
+ACCEPT_ENCODING = ', '.join(supported_encodings())  # What a browser would send, minus what we can't decode
+# Read-only routes that are also measured logged out: the page cache and 304 path most visitors get
+ANONYMOUS_ROUTES = ('home', 'blog_page', 'show_post')
+SENTENCES = ['肥満治療の選択肢は年々増えています。', '食事と運動の習慣を少しずつ見直しましょう。',
+             'GLP-1受容体作動薬は体重管理に使われます。', '睡眠不足は代謝に影響します。',
+             'Weight management is a long-term process.', '定期的な診療で血糖値を確認します。']
+
+
+def ckeditor_body(rng, size):
+    # Roughly what CKEditor produces: headings, paragraphs and the odd figure
+    parts = []
+    while sum(len(part) for part in parts) < size:
+        choice = rng.random()
+        if choice < 0.1:
+            parts.append(f"<h2>{rng.choice(SENTENCES)}</h2>")
+        elif choice < 0.15:
+            parts.append(f'<figure class="image"><img src="/uploads/{rng.getrandbits(128):032x}.jpg"></figure>')
+        else:
+            parts.append(f"<p>{''.join(rng.choices(SENTENCES, k=rng.randint(3, 8)))}</p>")
+    return ''.join(parts)
+
+
+def seed(args):
+    from main import app, db
+    from database import User, BlogPost, Comment
+    from werkzeug.security import generate_password_hash
+    rng = random.Random(args.seed)
+    password_hash = generate_password_hash(PASSWORD, method='pbkdf2:sha256:1000')
+    with app.app_context():
+        db.drop_all(bind_key=None)
+        db.create_all(bind_key=None)
+        db.session.add_all(User(username=f"user{i}", email=f"user{i}@example.com", first_name=f"First{i}",
+                                last_name=f"Last{i}", password=password_hash) for i in range(1, args.users + 1))
+        db.session.commit()
+        for i in range(1, args.posts + 1):
+            db.session.add(BlogPost(title=f"Post {i}", subtitle=rng.choice(SENTENCES), body=ckeditor_body(rng, args.body_size),
+                                    author_id=1, img_url='https://example.com/image.jpg'))
+            if i % 200 == 0:
+                db.session.commit()
+        db.session.commit()
+        comments = [Comment(text=rng.choice(SENTENCES), author_id=rng.randint(1, args.users), post_id=post_id)
+                    for post_id in range(1, args.posts + 1) for _ in range(rng.randint(0, args.comments * 2))]
+        for start in range(0, len(comments), 1000):
+            db.session.add_all(comments[start:start + 1000])
+            db.session.commit()
+
+
+def route_plan(args):
+    rng = random.Random(args.seed)
+    pages = max(1, args.posts // 10)
+    return {
+        'home': lambda: ('GET', '/', None),
+        'blog_page': lambda: ('GET', f"/blog?page={rng.randint(1, pages)}", None),
+        'show_post': lambda: ('GET', f"/blog/post/{rng.randint(1, args.posts)}", None),
+        'comment_post': lambda: ('POST', f"/blog/post/{rng.randint(1, args.posts)}",
+                                 {'comment_text': rng.choice(SENTENCES)}),
+        'contact': lambda: ('POST', '/contact', {'name': 'Bench', 'email': 'bench@example.com',
+                                                 'message': rng.choice(SENTENCES)}),
+    }
+
+
+class InProcessClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+        self.etags = None  # path -> ETag, when revalidating like a browser with a cache
+
+    def get(self, path):
+        headers = {'Accept-Encoding': ACCEPT_ENCODING}
+        if self.etags and path in self.etags:
+            headers['If-None-Match'] = self.etags[path]
+        response = self.client.get(path, follow_redirects=True, headers=headers)
+        if self.etags is not None and 'ETag' in response.headers:
+            self.etags[path] = response.headers['ETag']
+        body = response.get_data()
+        # The test client doesn't decode like requests does; the compression cost is still measured
+        if response.headers.get('Content-Encoding') == 'br':
+            body = brotli.decompress(body)
+        elif response.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return response.status_code, body.decode()
+
+    def post(self, path, data):
+        response = self.client.post(path, data=data)
+        return response.status_code, ''
+
+
+class HTTPClient:
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url
+        self.session = requests.Session()
+        self.session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+        self.etags = None
+
+    def get(self, path):
+        headers = {'If-None-Match': self.etags[path]} if self.etags and path in self.etags else {}
+        response = self.session.get(self.base_url + path, headers=headers)
+        if self.etags is not None and 'ETag' in response.headers:
+            self.etags[path] = response.headers['ETag']
+        return response.status_code, response.text
+
+    def post(self, path, data):
+        response = self.session.post(self.base_url + path, data=data, allow_redirects=False)
+        return response.status_code, ''
+
+
+def prepare_client(client, user_number):
+    # Log in (comment POSTs need a user) and keep one CSRF token per session
+    status, page = client.get('/login')
+    client.post('/login', {'username': f"user{user_number}", 'password': PASSWORD,
+                           'csrf_token': CSRF_PATTERN.search(page).group(1)})
+    status, page = client.get('/contact')
+    return CSRF_PATTERN.search(page).group(1)
+
+
+def run_route(make_client, name, next_request, total, concurrency, users, viewer='user'):
+    # viewer 'anonymous' never logs in and revalidates with If-None-Match like a browser would
+    latencies = []
+    errors = 0
+    not_modified = 0
+    lock = threading.Lock()
+    per_thread = [total // concurrency + (1 if i < total % concurrency else 0) for i in range(concurrency)]
+
+    def worker(index):
+        nonlocal errors, not_modified
+        client = make_client()
+        if viewer == 'anonymous':
+            client.etags = {}
+            csrf_token = None
+        else:
+            csrf_token = prepare_client(client, index % users + 1)
+        local = []
+        local_errors = 0
+        local_not_modified = 0
+        for _ in range(per_thread[index]):
+            method, path, data = next_request()
+            start = time.perf_counter()
+            if method == 'GET':
+                status, _ = client.get(path)
+            else:
+                status, _ = client.post(path, dict(data, csrf_token=csrf_token))
+            local.append(time.perf_counter() - start)
+            if status >= 400:
+                local_errors += 1
+            elif status == 304:
+                local_not_modified += 1
+        with lock:
+            latencies.extend(local)
+            errors += local_errors
+            not_modified += local_not_modified
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2)
+
+    return {
+        'route': name,
+        'viewer': viewer,
+        'requests': len(latencies),
+        'errors': errors,
+        'not_modified': not_modified,
+        'rps': round(len(latencies) / elapsed, 1),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 2),
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+    }
+
+
+def run_suite(mode, make_client, args):
+    results = []
+    runs = [(name, 'user') for name in route_plan(args)]
+    if not args.logged_in_only:
+        runs += [(name, 'anonymous') for name in ANONYMOUS_ROUTES]
+    for name, viewer in runs:
+        if args.routes and name not in args.routes:
+            continue
+        # A fresh plan per run, so logged-in and anonymous runs request the same paths
+        next_request = route_plan(args)[name]
+        result = run_route(make_client, name, next_request, args.requests, args.concurrency, args.users, viewer)
+        result['mode'] = mode
+        print(f"{mode:<10} {name:<14} {viewer:<10} {result['rps']:>8} req/s  p50 {result['p50_ms']:>7} ms  "
+              f"p95 {result['p95_ms']:>7} ms  p99 {result['p99_ms']:>7} ms  304s {result['not_modified']:>5}  "
+              f"errors {result['errors']}")
+        results.append(result)
+    return results
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(args):
+    import requests
+    port = free_port()
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', 'main:app', '-w', str(args.workers),
+                                '-b', f"127.0.0.1:{port}", '--log-level', 'warning'], cwd=HERE, env=os.environ.copy())
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            requests.get(base_url + '/about', timeout=10)
+            return process, base_url
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("gunicorn did not start within 60 seconds")
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    # Results from before anonymous runs existed were all logged in
+    previous = {(result['mode'], result['route'], result.get('viewer', 'user')): result
+                for result in baseline['results']}
+    print(f"Compared with {baseline.get('revision')} ({baseline_path}):")
+    for result in results:
+        before = previous.get((result['mode'], result['route'], result['viewer']))
+        if before is None:
+            continue
+        rps_change = (result['rps'] - before['rps']) / before['rps'] * 100 if before['rps'] else 0
+        print(f"{result['mode']:<10} {result['route']:<14} {result['viewer']:<10} req/s {rps_change:+6.1f}%  "
+              f"p95 {before['p95_ms']} -> {result['p95_ms']} ms  p99 {before['p99_ms']} -> {result['p99_ms']} ms")
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True, cwd=HERE).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def configure_environment(args, workdir):
+    from graph_stub import start_stub
+    stub = start_stub()
+    os.environ.update({
+        'SQLALCHEMY_DATABASE_URI': args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.sqlite3')}",
+        'TOKEN_URL': f"{stub.base_url}/token",
+        'GRAPH_ENDPOINT': f"{stub.base_url}/v1.0",
+        'PAGE_CACHE_PATH': os.path.join(workdir, 'page_cache.sqlite3'),
+        'TOKEN_CACHE_PATH': os.path.join(workdir, 'graph_token.json'),
+        'JINJA_CACHE_DIR': os.path.join(workdir, 'jinja'),
+        'LOG_LEVEL': 'WARNING',
+    })
+    # Placeholders for settings the app requires but the benchmark never really uses
+    for name, value in (('FLASK_SECRET_KEY', 'benchmark'), ('MY_EMAIL', 'owner@example.com'),
+                        ('CLIENT_365_ID', 'bench'), ('CLIENT_365_SECRET', 'bench'), ('TENANT_365_ID', 'bench'),
+                        ('REDIRECT_URI', 'http://localhost/callback'), ('REFRESH_TOKEN', 'bench')):
+        os.environ.setdefault(name, value)
+    return stub
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the blog routes.')
+    parser.add_argument('--mode', choices=['inprocess', 'gunicorn', 'both'], default='inprocess')
+    parser.add_argument('--database-url', help='Database to seed and use (default: a temporary SQLite file)')
+    parser.add_argument('--reset', action='store_true', help='Drop and reseed --database-url')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--posts', type=int, default=200)
+    parser.add_argument('--comments', type=int, default=5, help='Average comments per post')
+    parser.add_argument('--body-size', type=int, default=12000, help='Approximate post body size in characters')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per route')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--routes', nargs='*', help='Only run these routes')
+    parser.add_argument('--logged-in-only', action='store_true', help='Skip the anonymous runs of the read routes')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', help='Earlier results file to compare against')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='blog-bench-')
+    os.chdir(HERE)
+    sys.path.insert(0, HERE)
+    configure_environment(args, workdir)
+    if args.database_url is None or args.reset:
+        seed(args)
+
+    results = []
+    if args.mode in ('inprocess', 'both'):
+        from main import app
+        results += run_suite('inprocess', lambda: InProcessClient(app), args)
+    if args.mode in ('gunicorn', 'both'):
+        process, base_url = start_gunicorn(args)
+        try:
+            results += run_suite('gunicorn', lambda: HTTPClient(base_url), args)
+        finally:
+            process.send_signal(signal.SIGTERM)
+            process.wait(timeout=30)
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'revision': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'config': {key: value for key, value in vars(args).items()
+                       if key not in ('output', 'baseline', 'database_url')},
+            'results': results,
+        }, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.baseline:
+        compare(results, args.baseline)
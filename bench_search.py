@@ -0,0 +1,78 @@
+import argparse
+import random
+import statistics
+import time
+from search import MemorySearchIndex, MySQLFullTextSearch
+
+# Benchmark for the /search backends.
+#   python bench_search.py --posts 5000            in-process index over a synthetic corpus
+#   python bench_search.py --source db --mysql     both backends over the posts in DATABASE_URL
+
+VOCABULARY = ['肥満', '治療', '体重', '管理', '食事', '運動', '糖尿病', '血糖', '薬', '副作用', '睡眠', '代謝',
+              'ホルモン', '脂肪', '筋肉', 'カロリー', 'たんぱく質', '高血圧', '生活習慣', '診療', 'オンライン', '医師',
+              'GLP-1', 'BMI', 'clinic', 'diet', 'は', 'が', 'を', 'に', 'で', 'と', 'です', 'ます', '。', '、']
+QUERIES = ['肥満治療', '体重管理', '糖尿病', '睡眠', 'GLP-1', '食事と運動', 'オンライン診療', '副作用', 'BMI', '代謝']
+
+
+def synthetic_posts(count, words_per_post, seed=1):
+    rng = random.Random(seed)
+    for post_id in range(1, count + 1):
+        title = ''.join(rng.choices(VOCABULARY[:24], k=4))
+        body = ''.join(rng.choices(VOCABULARY, k=words_per_post))
+        yield post_id, title, 'subtitle', body
+
+
+def time_queries(search, repeat):
+    timings = []
+    for _ in range(repeat):
+        for query in QUERIES:
+            start = time.perf_counter()
+            search(query)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'queries': len(timings),
+        'mean_ms': round(statistics.mean(timings), 3),
+        'p50_ms': round(timings[len(timings) // 2], 3),
+        'p95_ms': round(timings[int(len(timings) * 0.95) - 1], 3),
+    }
+
+
+def report(name, build_seconds, stats):
+    build = f"build {build_seconds * 1000:.1f} ms, " if build_seconds is not None else ""
+    print(f"{name:<10} {build}{stats['queries']} queries: mean {stats['mean_ms']} ms, "
+          f"p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms")
+
+
+def bench_synthetic(args):
+    index = MemorySearchIndex()
+    index.sync = lambda: None  # No database behind the synthetic corpus
+    start = time.perf_counter()
+    for post in synthetic_posts(args.posts, args.words):
+        index.add(*post)
+    report('memory', time.perf_counter() - start, time_queries(index.search, args.repeat))
+
+
+def bench_db(args):
+    from outbox import create_worker_app
+    with create_worker_app().app_context():
+        index = MemorySearchIndex()
+        start = time.perf_counter()
+        index.sync()
+        report('memory', time.perf_counter() - start, time_queries(index.search, args.repeat))
+        if args.mysql:
+            report('mysql', None, time_queries(MySQLFullTextSearch().search, args.repeat))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the search backends.')
+    parser.add_argument('--source', choices=['synthetic', 'db'], default='synthetic')
+    parser.add_argument('--posts', type=int, default=2000, help='Synthetic corpus size')
+    parser.add_argument('--words', type=int, default=800, help='Tokens per synthetic post body')
+    parser.add_argument('--repeat', type=int, default=20, help='Times each query is run')
+    parser.add_argument('--mysql', action='store_true', help='Also time MySQL FULLTEXT (needs --source db)')
+    args = parser.parse_args()
+    if args.source == 'db':
+        bench_db(args)
+    else:
+        bench_synthetic(args)
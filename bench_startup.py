@@ -0,0 +1,69 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Measures worker cold start: a fresh interpreter importing main.py, as a gunicorn worker does.
+#   python bench_startup.py --runs 10 --output startup.json
+# Each run reports wall time for the import and the app's own STARTUP_SECONDS measurement.
+
+CHILD = """
+import json, time
+started = time.perf_counter()
+import main
+with main.app.test_request_context():
+    first_render_started = time.perf_counter()
+    main.render_template('about.html')
+    first_render = time.perf_counter() - first_render_started
+print(json.dumps({'import_s': time.perf_counter() - started - first_render,
+                  'startup_s': main.app.config['STARTUP_SECONDS'],
+                  'first_render_s': first_render}))
+"""
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_once(extra_env):
+    env = dict(os.environ, **extra_env)
+    output = subprocess.check_output([sys.executable, '-c', CHILD], env=env, text=True,
+                                     stderr=subprocess.DEVNULL, cwd=os.path.dirname(os.path.abspath(__file__)))
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(samples, field):
+    values = sorted(sample[field] * 1000 for sample in samples)
+    return {'median_ms': round(statistics.median(values), 1), 'min_ms': round(values[0], 1),
+            'max_ms': round(values[-1], 1)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure application cold start time.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--prewarm', action='store_true', help='Run with PREWARM_TEMPLATES=1')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    extra_env = {'PREWARM_TEMPLATES': '1' if args.prewarm else '0'}
+    samples = [run_once(extra_env) for _ in range(args.runs)]
+    result = {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'runs': args.runs,
+        'prewarm_templates': args.prewarm,
+        'import': summarize(samples, 'import_s'),
+        'startup': summarize(samples, 'startup_s'),
+        'first_render': summarize(samples, 'first_render_s'),
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
@@ -0,0 +1,105 @@
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+import gzip
+
+# Brotli is optional; without it responses are only gzip-compressed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml',
+                      'application/atom+xml', 'application/rss+xml', 'image/svg+xml')
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def supported_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate_encoding(accept_encoding, available=None):
+    accepted = parse_accept_header(accept_encoding or '')
+    for encoding in supported_encodings():
+        if available is not None and encoding not in available:
+            continue
+        if accepted.quality(encoding) > 0:
+            return encoding
+    return None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress_variants(data, min_size):
+    # Every supported encoding of a body, computed once so cached pages are never recompressed
+    if len(data) < min_size:
+        return {}
+    return {encoding: compress(data, encoding) for encoding in supported_encodings()}
+
+
+class CompressionMiddleware:
+    """WSGI middleware that gzip/brotli-compresses HTML, JSON and other text responses.
+
+    Responses that are already encoded (precompressed assets, cached pages), streamed
+    files, partial/empty responses and bodies under ``min_size`` bytes pass through untouched.
+    """
+
+    def __init__(self, app, min_size=500):
+        self.app = app
+        self.min_size = min_size
+
+    def __call__(self, environ, start_response):
+        encoding = negotiate_encoding(environ.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None or environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.app(environ, start_response)
+
+        captured = {}
+
+        def capture_start_response(status, headers, exc_info=None):
+            if self._should_compress(status, Headers(headers)):
+                captured['status'] = status
+                captured['headers'] = headers
+                captured['exc_info'] = exc_info
+                return self._unsupported_write
+            return start_response(status, headers, exc_info)
+
+        app_iter = self.app(environ, capture_start_response)
+        if not captured:
+            return app_iter
+        try:
+            body = b''.join(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+        headers = Headers(captured['headers'])
+        if len(body) >= self.min_size:
+            body = compress(body, encoding)
+            headers['Content-Encoding'] = encoding
+        vary = {value.strip() for value in headers.get('Vary', '').split(',') if value.strip()}
+        if 'Accept-Encoding' not in vary:
+            headers['Vary'] = ', '.join(sorted(vary | {'Accept-Encoding'}))
+        headers['Content-Length'] = str(len(body))
+        start_response(captured['status'], headers.to_wsgi_list(), captured['exc_info'])
+        return [body]
+
+    def _should_compress(self, status, headers):
+        if not status.startswith('200') or 'Content-Encoding' in headers:
+            return False
+        if 'no-transform' in headers.get('Cache-Control', ''):
+            return False
+        if not headers.get('Content-Type', '').startswith(COMPRESSIBLE_TYPES):
+            return False
+        content_length = headers.get('Content-Length')
+        # Small bodies aren't worth it; file downloads (Accept-Ranges) are left to stream
+        if content_length is not None and int(content_length) < self.min_size:
+            return False
+        return 'Accept-Ranges' not in headers
+
+    @staticmethod
+    def _unsupported_write(data):
+        raise RuntimeError("CompressionMiddleware does not support the WSGI write() callable")
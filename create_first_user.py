@@ -17,7 +17,7 @@ db.init_app(app)
 
 with app.app_context():
     # Create all the tables
-    db.create_all()
+    db.create_all(bind_key=None)
 
     # Create the first user
     username = os.getenv("ADMIN")  # Username from the .env file
@@ -1,33 +1,144 @@
-from sqlalchemy import ForeignKey, Integer, String, Text, Boolean, DateTime, Column
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy import ForeignKey, Integer, String, Text, Boolean, DateTime, Column, Index, event, inspect, select, \
+    update, insert, delete, func
+from sqlalchemy.orm import declarative_base, relationship, deferred, object_session
+from sqlalchemy.pool import QueuePool
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 import os
+import threading
+import time
 from dotenv import load_dotenv
+from text_utils import html_to_text, make_excerpt, reading_time_minutes
+from replicas import RoutingSession
 
 # Load environment variables
 load_dotenv(os.path.expanduser('~/config/.env'))
 
-# Get password from environment variable
-mysql_password = os.environ.get('MYSQL_PASSWORD')
-if not mysql_password:
-    raise ValueError("MYSQL_PASSWORD environment variable is not set.")
+# A full SQLALCHEMY_DATABASE_URI (e.g. a local database for benchmarks) takes precedence over MYSQL_*
+DATABASE_URL = os.environ.get('SQLALCHEMY_DATABASE_URI')
 
-# Get other environment variables
-mysql_user = os.environ.get('MYSQL_USER', 'root')
-mysql_host = os.environ.get('MYSQL_HOST', 'localhost')
-mysql_db = os.environ.get('MYSQL_DB', 'telemedicine')
+if not DATABASE_URL:
+    # Get password from environment variable
+    mysql_password = os.environ.get('MYSQL_PASSWORD')
+    if not mysql_password:
+        raise ValueError("MYSQL_PASSWORD environment variable is not set.")
+
+    # Get other environment variables
+    mysql_user = os.environ.get('MYSQL_USER', 'root')
+    mysql_host = os.environ.get('MYSQL_HOST', 'localhost')
+    mysql_db = os.environ.get('MYSQL_DB', 'telemedicine')
+
+    # Setup the database connection
+    DATABASE_URL = f"mysql+pymysql://{mysql_user}:{mysql_password}@{mysql_host}/{mysql_db}"
+
+# Connection pool configuration, sized against the number of gunicorn workers/threads
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 20))  # Seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 28000))  # Must stay below the MySQL wait_timeout
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+MYSQL_SESSION_TIMEOUT = int(os.environ.get('MYSQL_SESSION_TIMEOUT', 28800))
+
+
+class PoolStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.in_use = 0
+        self.max_in_use = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def checked_out(self):
+        with self._lock:
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+
+    def checked_in(self):
+        with self._lock:
+            self.in_use -= 1
+
+    def snapshot(self, pool=None):
+        with self._lock:
+            stats = {
+                'pid': os.getpid(),
+                'checkouts': self.checkouts,
+                'in_use': self.in_use,
+                'max_in_use': self.max_in_use,
+                'wait_avg_ms': round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                'wait_max_ms': round(self.wait_max * 1000, 3),
+            }
+        if pool is not None:
+            stats['pool_status'] = pool.status()
+        return stats
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(QueuePool):
+    # Times how long each checkout waits for a free connection
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_stats.record_wait(time.perf_counter() - start)
+
+
+def engine_options():
+    return {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+    }
+
+
+def init_engine_events(engine):
+    # Runs once per physical connection instead of once per request
+    @event.listens_for(engine, 'connect')
+    def set_session_timeouts(dbapi_connection, connection_record):
+        if engine.dialect.name != 'mysql':
+            return
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"SET SESSION wait_timeout = {MYSQL_SESSION_TIMEOUT}, "
+                       f"interactive_timeout = {MYSQL_SESSION_TIMEOUT}")
+        cursor.close()
+
+    @event.listens_for(engine, 'connect')
+    def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+        # Local/benchmark databases: SQLite only honours ON DELETE CASCADE with this on
+        if engine.dialect.name != 'sqlite':
+            return
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys = ON')
+        cursor.close()
+
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        pool_stats.checked_out()
+
+    @event.listens_for(engine, 'checkin')
+    def on_checkin(dbapi_connection, connection_record):
+        pool_stats.checked_in()
 
-# Setup the database connection
-DATABASE_URL = f"mysql+pymysql://{mysql_user}:{mysql_password}@{mysql_host}/{mysql_db}"
 
 # Define the declarative base
 Base = declarative_base()
 
-# Initialize SQLAlchemy with the base model
-db = SQLAlchemy(model_class=Base)
+# Initialize SQLAlchemy with the base model; reads can be routed to replicas (see replicas.py)
+db = SQLAlchemy(model_class=Base, session_options={'class_': RoutingSession})
 
 
 # Models
@@ -41,7 +152,9 @@ class User(UserMixin, db.Model):
     password = db.Column(db.String(256))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     posts = db.relationship('BlogPost', backref='author', lazy=True)
-    comments = db.relationship('Comment', backref='comment_author', lazy=True, overlaps="user_comments,comments")
+    # Comments are removed by the database (ON DELETE CASCADE), never loaded to be deleted
+    comments = db.relationship('Comment', back_populates='author', lazy=True, cascade="all, delete-orphan",
+                               passive_deletes=True)
 
     def set_password(self, password):
         self.password = generate_password_hash(password)
@@ -59,6 +172,24 @@ class Contact(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+class EmailOutbox(db.Model):
+    __tablename__ = 'email_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False)
+    email = db.Column(db.String(120), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    # pending -> sending -> sent, or dead once the retry budget is spent
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    digest_key = db.Column(db.String(191), nullable=True)  # e.g. 'comment:post:3' or 'contact:someone@example.com'
+    __table_args__ = (db.Index('ix_email_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+                      db.Index('ix_email_outbox_digest_key_status', 'digest_key', 'status'))
+
+
 class BlogPost(db.Model):
     __tablename__ = 'blog_posts'
     id = Column(Integer, primary_key=True)
@@ -69,9 +200,45 @@ class BlogPost(db.Model):
     body = Column(Text, nullable=False)
     author_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     img_url = Column(String(500), nullable=True)
-    comments = relationship('Comment', backref='post_comments', lazy=True, cascade="all, delete-orphan",
-                            overlaps="comments,post_comments")
+    comments = relationship('Comment', back_populates='post', lazy=True, cascade="all, delete-orphan",
+                            passive_deletes=True)
     draft = Column(Boolean, default=True)
+    # Precomputed from body on save so listings never need to load body
+    excerpt = Column(String(300), nullable=True)
+    reading_time = Column(Integer, nullable=True)  # Minutes
+    # Plain text of body for the search index; never needed by the views
+    search_text = deferred(Column(Text, nullable=True))
+    # Denormalized so listings never join users or count comments; kept in step by the events
+    # below and fixable with `flask repair-counters`
+    comment_count = Column(Integer, nullable=False, default=0, server_default='0')
+    author_name = Column(String(101), nullable=True)
+    # Search index sync looks up MAX(last_edited) and posts edited since then; the API's ?since=
+    # looks for posts added or edited after a time
+    __table_args__ = (Index('ix_blog_posts_last_edited', 'last_edited'), Index('ix_blog_posts_date', 'date'))
+
+
+def display_name(first_name, last_name):
+    return ' '.join(part for part in (first_name, last_name) if part)
+
+
+@event.listens_for(BlogPost, 'before_insert')
+@event.listens_for(BlogPost, 'before_update')
+def update_post_summary(mapper, connection, target):
+    if target.excerpt is not None and not inspect(target).attrs.body.history.has_changes():
+        return
+    body_text = html_to_text(target.body)
+    target.excerpt = make_excerpt(body_text)
+    target.reading_time = reading_time_minutes(body_text)
+    target.search_text = body_text
+
+
+@event.listens_for(BlogPost, 'before_insert')
+@event.listens_for(BlogPost, 'before_update')
+def update_post_author_name(mapper, connection, target):
+    if target.author_name is not None and not inspect(target).attrs.author_id.history.has_changes():
+        return
+    row = connection.execute(select(User.first_name, User.last_name).where(User.id == target.author_id)).first()
+    target.author_name = display_name(*row) if row else None
 
 
 class Comment(db.Model):
@@ -81,8 +248,96 @@ class Comment(db.Model):
     date_posted = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     author_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     post_id = db.Column(db.Integer, db.ForeignKey('blog_posts.id', ondelete='CASCADE'), nullable=False)
+    # A post's comments are always read in posting order
+    __table_args__ = (db.Index('ix_comments_post_id_date_posted', 'post_id', 'date_posted'),)
+
+    author = db.relationship('User', back_populates='comments')
+    post = db.relationship('BlogPost', back_populates='comments')
+
+
+class ContentVersion(db.Model):
+    # Bumped by changes the listing watermarks (queries.py) can't see from MAX() alone: deletions,
+    # renamed authors and repaired counters. One row per name, read by primary key.
+    __tablename__ = 'content_versions'
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+def bump_content_version(connection, name='posts'):
+    # Runs in the caller's transaction, so the new version is visible exactly when the change is
+    values = {'version': ContentVersion.version + 1, 'updated_at': datetime.utcnow()}
+    if not connection.execute(update(ContentVersion).where(ContentVersion.name == name).values(values)).rowcount:
+        connection.execute(insert(ContentVersion).values(name=name, version=1, updated_at=values['updated_at']))
+
+
+def mark_pages_stale(target, tags):
+    # Page-cache tags to evict once the change commits (main.py invalidates them after_commit)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('stale_pages', set()).update(tags)
+
+
+# Comment counters are adjusted in the same flush as the comment itself. Bulk query.delete()
+# and ON DELETE CASCADE bypass these events, so use repair_post_counters() after one (deleting
+# a user is covered by discount_user_comments below).
+@event.listens_for(Comment, 'after_insert')
+def increment_comment_count(mapper, connection, target):
+    connection.execute(update(BlogPost).where(BlogPost.id == target.post_id)
+                       .values(comment_count=BlogPost.comment_count + 1))
+
+
+@event.listens_for(Comment, 'after_delete')
+def decrement_comment_count(mapper, connection, target):
+    connection.execute(update(BlogPost).where(BlogPost.id == target.post_id, BlogPost.comment_count > 0)
+                       .values(comment_count=BlogPost.comment_count - 1))
+    bump_content_version(connection)
+
+
+@event.listens_for(User, 'before_delete')
+def discount_user_comments(mapper, connection, target):
+    # The user's comments go with ON DELETE CASCADE, so take them off the other posts' counts first
+    commented = select(Comment.post_id).where(Comment.author_id == target.id)
+    removed = select(func.count(Comment.id)) \
+        .where(Comment.post_id == BlogPost.id, Comment.author_id == target.id).scalar_subquery()
+    post_ids = connection.execute(commented.distinct()).scalars().all()
+    connection.execute(update(BlogPost).where(BlogPost.id.in_(commented))
+                       .values(comment_count=BlogPost.comment_count - removed))
+    bump_content_version(connection)
+    mark_pages_stale(target, ['posts', *(f'post:{post_id}' for post_id in post_ids)])
+
+
+@event.listens_for(User, 'after_update')
+def update_author_names(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.first_name.history.has_changes() or state.attrs.last_name.history.has_changes():
+        connection.execute(update(BlogPost).where(BlogPost.author_id == target.id)
+                           .values(author_name=display_name(target.first_name, target.last_name)))
+        bump_content_version(connection)
+        # Their posts show the name as author, and the posts they commented on next to the comments
+        post_ids = connection.execute(select(BlogPost.id).where(BlogPost.author_id == target.id)
+                                      .union(select(Comment.post_id).where(Comment.author_id == target.id))) \
+            .scalars().all()
+        mark_pages_stale(target, ['posts', 'feed', *(f'post:{post_id}' for post_id in post_ids)])
+
+
+def delete_posts(post_ids):
+    # One DELETE however many posts and comments there are: comments go with ON DELETE CASCADE.
+    # Returns the number of posts deleted; the caller commits.
+    result = db.session.execute(delete(BlogPost).where(BlogPost.id.in_(post_ids))
+                                .execution_options(synchronize_session='fetch'))
+    if result.rowcount:
+        bump_content_version(db.session.connection())
+    return result.rowcount
+
 
-    author = db.relationship('User', backref=db.backref('user_comments', lazy=True, cascade="all, delete-orphan",
-                                                        overlaps="comment_author,comments"))
-    post = db.relationship('BlogPost', backref=db.backref('post_comments', lazy=True, cascade="all, delete-orphan",
-                                                          overlaps="comments,post_comments"))
+def repair_post_counters():
+    # Recomputes every denormalized column from the source tables; returns the number of posts touched
+    comment_count = select(func.count(Comment.id)).where(Comment.post_id == BlogPost.id).scalar_subquery()
+    author_name = select(func.trim(func.coalesce(User.first_name, '') + ' ' + func.coalesce(User.last_name, ''))) \
+        .where(User.id == BlogPost.author_id).scalar_subquery()
+    result = db.session.execute(update(BlogPost).values(comment_count=comment_count, author_name=author_name)
+                                .execution_options(synchronize_session=False))
+    bump_content_version(db.session.connection())
+    db.session.commit()
+    return result.rowcount
@@ -1,28 +1,47 @@
 from dotenv import load_dotenv
+import fcntl
+import hashlib
+import json
 import logging
 import requests
 import os
+import threading
+import time
 
 # Configure logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
 logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv(os.path.expanduser('~/config/.env'))
 
-# Email configuration
-my_email = os.environ["MY_EMAIL"]
-client_id = os.environ['CLIENT_365_ID']
-client_secret = os.environ['CLIENT_365_SECRET']
-tenant_id = os.environ['TENANT_365_ID']
-token_url = f"https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/token"
+# Email configuration. The recipient and Microsoft 365 credentials are read when mail is sent,
+# so importing this module (and with it the web app) doesn't require them.
+# Endpoints can be pointed at a local stand-in server (see graph_stub.py)
+GRAPH_ENDPOINT = os.environ.get('GRAPH_ENDPOINT', 'https://graph.microsoft.com/v1.0')
+REQUEST_TIMEOUT = (5, 30)  # Connect and read timeouts in seconds
+TOKEN_CACHE_PATH = os.environ.get('TOKEN_CACHE_PATH', 'graph_token.json')
+TOKEN_EXPIRY_MARGIN = 300  # Refresh this many seconds before the access token expires
+
+# Pooled session reused for both the token endpoint and Graph
+http = requests.Session()
+
+
+def my_email():
+    return os.environ["MY_EMAIL"]
+
+
+def token_url():
+    return os.environ.get('TOKEN_URL') or \
+        f"https://login.microsoftonline.com/{os.environ['TENANT_365_ID']}/oauth2/v2.0/token"
+
 
 def get_access_token(refresh_token):
     payload = {
-        'client_id': client_id,
+        'client_id': os.environ['CLIENT_365_ID'],
         'scope': 'offline_access Mail.ReadWrite Mail.send',
         'grant_type': 'refresh_token',
-        'client_secret': client_secret,
+        'client_secret': os.environ['CLIENT_365_SECRET'],
         'refresh_token': refresh_token
     }
 
@@ -31,25 +50,137 @@ def get_access_token(refresh_token):
     }
 
     try:
-        response = requests.post(token_url, headers=headers, data=payload)
+        response = http.post(token_url(), headers=headers, data=payload, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()  # Check for request's success
         return response.json()
     except requests.exceptions.RequestException as e:
         logger.exception("An error occurred while requesting the token")
         return None
 
-def send_message_email(name, email, message):
-    refresh_token = os.environ['REFRESH_TOKEN']
-    tokens = get_access_token(refresh_token)
-    if tokens is None:
-        logger.error("Failed to obtain access token.")
-        return False
 
-    access_token = tokens.get('access_token')
-    if not access_token:
-        logger.error("No access token found in the response.")
-        return False
+class TokenManager:
+    """Caches the Graph access token until shortly before it expires.
+
+    The token and the rotated refresh token are kept in a JSON file shared by every
+    gunicorn worker. Refreshes happen under a thread lock and an exclusive file lock,
+    so concurrent senders wait for one refresh instead of each calling the token endpoint.
+    The file records which REFRESH_TOKEN it started from and is discarded when that changes.
+    """
+
+    def __init__(self, cache_path, initial_refresh_token):
+        self.cache_path = cache_path
+        self.initial_refresh_token = initial_refresh_token
+        # Which REFRESH_TOKEN the cache file was derived from, without storing the token itself again
+        self.seed = hashlib.sha256(initial_refresh_token.encode('utf-8')).hexdigest()[:16] \
+            if initial_refresh_token else None
+        self._lock = threading.Lock()
+        self._access_token = None
+        self._expires_at = 0
+
+    def get_token(self):
+        if self._is_fresh(self._expires_at):
+            return self._access_token
+        with self._lock:
+            if self._is_fresh(self._expires_at):
+                return self._access_token
+            with open(self.cache_path + '.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    # Another worker may have refreshed while we waited for the lock
+                    state = self._read_state()
+                    if state.get('seed', self.seed) != self.seed:
+                        # REFRESH_TOKEN was replaced (e.g. with refresh_token.py); start over from it
+                        logger.info("REFRESH_TOKEN changed; discarding the cached Graph tokens")
+                        state = {}
+                    if not self._is_fresh(state.get('expires_at', 0)):
+                        refresh_token = state.get('refresh_token') or self.initial_refresh_token
+                        state = self._refresh(refresh_token)
+                        if state is None and self.initial_refresh_token and refresh_token != self.initial_refresh_token:
+                            # The stored token may have been revoked or expired; try the configured one
+                            logger.warning("Cached refresh token was rejected; retrying with REFRESH_TOKEN")
+                            state = self._refresh(self.initial_refresh_token)
+                        if state is None:
+                            return None
+                        self._write_state(state)
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+            self._access_token = state['access_token']
+            self._expires_at = state['expires_at']
+            return self._access_token
+
+    def invalidate(self):
+        with self._lock:
+            self._access_token = None
+            self._expires_at = 0
+            with open(self.cache_path + '.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    # Re-read under the file lock so a refresh written by another worker
+                    # (and its rotated refresh token) is kept; only the expiry is cleared
+                    state = self._read_state()
+                    if state:
+                        state['expires_at'] = 0
+                        self._write_state(state)
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
 
+    @staticmethod
+    def _is_fresh(expires_at):
+        return expires_at - TOKEN_EXPIRY_MARGIN > time.time()
+
+    def _refresh(self, refresh_token):
+        tokens = get_access_token(refresh_token)
+        if tokens is None or not tokens.get('access_token'):
+            logger.error("No access token found in the response.")
+            return None
+        return {
+            'access_token': tokens['access_token'],
+            'expires_at': time.time() + int(tokens.get('expires_in', 3600)),
+            # Microsoft rotates refresh tokens; keep the newest one
+            'refresh_token': tokens.get('refresh_token', refresh_token),
+            'seed': self.seed,
+        }
+
+    def _read_state(self):
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_state(self, state):
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.cache_path)
+
+
+token_manager = TokenManager(TOKEN_CACHE_PATH, os.environ.get('REFRESH_TOKEN'))
+
+
+GRAPH_BATCH_LIMIT = 20  # Maximum requests per Graph JSON batch
+
+
+def build_message(subject, html_content):
+    return {
+        'toRecipients': [
+            {
+                'emailAddress': {
+                    'address': my_email()
+                }
+            }
+        ],
+        'subject': subject,
+        "body": {
+            "contentType": "html",
+            "content": html_content
+        },
+        'importance': 'normal',
+    }
+
+
+def build_notification_message(name, email, message):
     html_content = f"""
     <html>
     <body>
@@ -59,43 +190,108 @@ def send_message_email(name, email, message):
     </body>
     </html>
     """
+    return build_message(f"New Contact Form Submission from {name}", html_content)
 
-    request_body = {
-        'message': {
-            'toRecipients': [
-                {
-                    'emailAddress': {
-                        'address': my_email
-                    }
-                }
-            ],
-            'subject': f"New Contact Form Submission from {name}",
-            "body": {
-                "contentType": "html",
-                "content": html_content
-            },
-            'importance': 'normal',
-        }
-    }
+
+def build_digest_message(notifications):
+    # notifications is a list of (name, email, message) grouped over one digest window
+    if len(notifications) == 1:
+        return build_notification_message(*notifications[0])
+    entries = "<hr>".join(f"""
+        <p>Name: {name}</p>
+        <p>Email: {email}</p>
+        <p>Message: {message}</p>
+    """ for name, email, message in notifications)
+    html_content = f"""
+    <html>
+    <body>
+        <p>{len(notifications)} new notifications</p>
+        {entries}
+    </body>
+    </html>
+    """
+    return build_message(f"{len(notifications)} new notifications", html_content)
+
+
+def send_mail(message):
+    access_token = token_manager.get_token()
+    if not access_token:
+        logger.error("Failed to obtain access token.")
+        return False
 
     headers = {
         'Authorization': 'Bearer ' + access_token
     }
 
-    GRAPH_ENDPOINT = 'https://graph.microsoft.com/v1.0'
     endpoint = GRAPH_ENDPOINT + '/me/sendMail'
 
     try:
-        response = requests.post(endpoint, headers=headers, json=request_body)
+        response = http.post(endpoint, headers=headers, json={'message': message}, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 401:
+            # Token was revoked or expired early; drop it so the next attempt refreshes
+            token_manager.invalidate()
         response.raise_for_status()  # Raise an exception if request fails
 
         if response.status_code == 202:
-            logger.info(f"Email sent to: {my_email}")
+            logger.info(f"Email sent to: {my_email()}")
             return True
         else:
-            logger.exception(f"Email not sent to: {my_email}")
+            logger.exception(f"Email not sent to: {my_email()}")
             return False
 
     except requests.exceptions.RequestException as e:
         logger.exception("An error occurred while sending the email")
         return False
+
+
+def send_mail_batch(messages):
+    """Send several messages with as few Graph calls as possible.
+
+    Messages are packed into JSON ``$batch`` requests of up to GRAPH_BATCH_LIMIT
+    ``sendMail`` calls each. Returns one success flag per message, in order.
+    """
+    if len(messages) == 1:
+        return [send_mail(messages[0])]
+
+    access_token = token_manager.get_token()
+    if not access_token:
+        logger.error("Failed to obtain access token.")
+        return [False] * len(messages)
+
+    headers = {
+        'Authorization': 'Bearer ' + access_token
+    }
+
+    results = []
+    for start in range(0, len(messages), GRAPH_BATCH_LIMIT):
+        chunk = messages[start:start + GRAPH_BATCH_LIMIT]
+        batch_body = {
+            'requests': [{
+                'id': str(i),
+                'method': 'POST',
+                'url': '/me/sendMail',
+                'headers': {'Content-Type': 'application/json'},
+                'body': {'message': message},
+            } for i, message in enumerate(chunk)]
+        }
+        statuses = {}
+        try:
+            response = http.post(GRAPH_ENDPOINT + '/$batch', headers=headers, json=batch_body,
+                                 timeout=REQUEST_TIMEOUT)
+            if response.status_code == 401:
+                token_manager.invalidate()
+            response.raise_for_status()
+            statuses = {item['id']: item.get('status') for item in response.json().get('responses', [])}
+        except (requests.exceptions.RequestException, ValueError):
+            logger.exception("An error occurred while sending the email batch")
+        for i in range(len(chunk)):
+            sent = statuses.get(str(i)) == 202
+            if not sent:
+                logger.error(f"Batched email {start + i} not sent to: {my_email()} (status {statuses.get(str(i))})")
+            results.append(sent)
+    logger.info(f"Sent {sum(results)} of {len(messages)} batched emails to: {my_email()}")
+    return results
+
+
+def send_message_email(name, email, message):
+    return send_mail(build_notification_message(name, email, message))
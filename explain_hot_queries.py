@@ -0,0 +1,139 @@
+import argparse
+import random
+import re
+import sys
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, text
+from database import db, User, BlogPost, Comment, EmailOutbox
+from queries import listing_query, comments_query, post_watermark_query, listing_watermark_query
+from outbox import create_worker_app
+from search import MemorySearchIndex
+
+# Query-plan check for the queries behind the busiest routes. Runs EXPLAIN (MySQL) or
+# EXPLAIN QUERY PLAN (SQLite) on each one and exits non-zero if any falls back to a full
+# table or index scan, so a dropped index or a rewritten query shows up before it reaches
+# production. tests/test_query_plans.py runs the same check under pytest on a seeded SQLite file.
+#   python explain_hot_queries.py --seed 5000      drop, reseed and check SQLALCHEMY_DATABASE_URI
+#   python explain_hot_queries.py                  check an existing database (e.g. a staging copy)
+
+
+def hot_queries():
+    # (name, statement, rowid_order) - rowid_order marks newest-first LIMIT queries whose plain
+    # primary-key "SCAN" stops after a page rather than reading the table (see full_scans)
+    now = datetime.utcnow()
+    return [
+        ('home latest posts', listing_query().order_by(BlogPost.id.desc()).limit(10).statement, True),
+        ('blog page (after cursor)',
+         listing_query().filter(BlogPost.id < 100).order_by(BlogPost.id.desc()).limit(11).statement, False),
+        ('blog page (before cursor)',
+         listing_query().filter(BlogPost.id > 100).order_by(BlogPost.id.asc()).limit(11).statement, False),
+        ('blog ?page= redirect',
+         select(BlogPost.id).order_by(BlogPost.id.desc()).offset(19).limit(1), True),
+        ('show post', select(BlogPost).where(BlogPost.id == 100), False),
+        ('post comments', comments_query(100).statement, False),
+        ('search results', listing_query().filter(BlogPost.id.in_([3, 50, 100])).statement, False),
+        ('search sync watermark', MemorySearchIndex.watermark_query(), False),
+        ('search sync changes',
+         select(BlogPost.id, BlogPost.title, BlogPost.subtitle, BlogPost.search_text).where(
+             (BlogPost.id > 100) | (BlogPost.last_edited > now - timedelta(days=1))), False),
+        ('post watermark', post_watermark_query(100), False),
+        ('listing watermark', listing_watermark_query(), False),
+        ('load user', select(User).where(User.id == 1), False),
+        ('login lookup', select(User).where(User.username == 'user1'), False),
+        ('register duplicate check',
+         select(User).where((User.email == 'user1@example.com') | (User.username == 'user1')).limit(1), False),
+        ('outbox claim',
+         select(EmailOutbox).where(EmailOutbox.status.in_(('pending', 'sending')),
+                                   EmailOutbox.next_attempt_at <= now)
+         .order_by(EmailOutbox.next_attempt_at).limit(50), False),
+        ('outbox digest rows',
+         select(EmailOutbox).where(EmailOutbox.status == 'pending', EmailOutbox.digest_key.in_(['comment:post:1']),
+                                   EmailOutbox.id.notin_([1, 2])), False),
+    ]
+
+
+def explain(connection, statement):
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={'render_postcompile': True})
+    params = compiled.construct_params()
+    if compiled.positiontup is not None:
+        params = tuple(params[name] for name in compiled.positiontup)
+    if connection.dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).all()
+        return [row[-1] for row in rows]
+    result = connection.exec_driver_sql(f"EXPLAIN {compiled}", params)
+    return [dict(zip(result.keys(), row)) for row in result.all()]
+
+
+def full_scans(dialect, plan, rowid_order):
+    # A full read of a table or of a whole index. rowid_order only excuses the plain primary-key
+    # walk of a newest-first LIMIT query, never an index scan (e.g. behind COUNT or MAX over two columns)
+    if dialect == 'sqlite':
+        # "SCAN t" reads the table, "SCAN t USING [COVERING] INDEX i" all of an index
+        scans = [step for step in plan if step.startswith('SCAN ') and step != 'SCAN CONSTANT ROW']
+        if rowid_order:
+            scans = [step for step in scans if not re.fullmatch(r'SCAN \w+( AS \w+)?', step)]
+        return scans
+    # type ALL is a table scan, type index a full index scan
+    return [f"{step['table']} (type {step['type']})" for step in plan
+            if step.get('type') == 'ALL'
+            or (step.get('type') == 'index' and not (rowid_order and step.get('key') == 'PRIMARY'))]
+
+
+def describe(dialect, plan):
+    if dialect == 'sqlite':
+        return '; '.join(plan)
+    return '; '.join(f"{step['table']}: {step['type']} key={step.get('key')} {step.get('Extra') or ''}".strip()
+                     for step in plan)
+
+
+def seed(posts, seed_value=1):
+    rng = random.Random(seed_value)
+    db.drop_all()
+    db.create_all()
+    now = datetime.utcnow()
+    users = max(2, posts // 10)
+    db.session.execute(insert(User), [
+        {'username': f"user{i}", 'email': f"user{i}@example.com", 'first_name': 'First', 'last_name': str(i),
+         'password': 'x'} for i in range(1, users + 1)])
+    db.session.execute(insert(BlogPost), [
+        {'title': f"Post {i}", 'subtitle': 'subtitle', 'body': '<p>body</p>', 'excerpt': 'body', 'reading_time': 1,
+         'author_id': 1, 'author_name': 'First 1', 'date': now - timedelta(hours=posts - i),
+         'last_edited': now - timedelta(hours=rng.randint(0, posts)) if rng.random() < 0.2 else None}
+        for i in range(1, posts + 1)])
+    db.session.execute(insert(Comment), [
+        {'text': 'comment', 'author_id': rng.randint(1, users), 'post_id': rng.randint(1, posts),
+         'date_posted': now - timedelta(minutes=rng.randint(0, posts * 60))} for _ in range(posts * 5)])
+    db.session.execute(insert(EmailOutbox), [
+        {'name': 'name', 'email': 'someone@example.com', 'message': 'message',
+         'status': 'sent' if rng.random() < 0.95 else 'pending', 'attempts': 1,
+         'next_attempt_at': now - timedelta(minutes=rng.randint(0, posts)),
+         'digest_key': f"comment:post:{rng.randint(1, posts)}"} for _ in range(posts)])
+    db.session.commit()
+    # Fresh statistics, so the planner sees the seeded table sizes
+    if db.engine.dialect.name == 'sqlite':
+        db.session.execute(text('ANALYZE'))
+    else:
+        db.session.execute(text('ANALYZE TABLE users, blog_posts, comments, email_outbox'))
+    db.session.commit()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fail if a hot query needs a full table scan.')
+    parser.add_argument('--seed', type=int, metavar='POSTS',
+                        help='Drop all tables and reseed with this many posts (and 5x as many comments) first')
+    args = parser.parse_args()
+
+    with create_worker_app().app_context():
+        if args.seed:
+            seed(args.seed)
+        dialect = db.engine.dialect.name
+        failures = 0
+        with db.engine.connect() as connection:
+            for name, statement, rowid_order in hot_queries():
+                plan = explain(connection, statement)
+                scans = full_scans(dialect, plan, rowid_order)
+                failures += bool(scans)
+                print(f"{'FULL SCAN' if scans else 'ok':<9} {name:<26} {describe(dialect, plan)}")
+    if failures:
+        print(f"{failures} hot queries fall back to a full table scan")
+        sys.exit(1)
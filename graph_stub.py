@@ -0,0 +1,75 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+import json
+import threading
+
+# Local stand-in for the Microsoft token endpoint and the Graph sendMail/$batch APIs.
+# Point email_utils at it with:
+#   TOKEN_URL=http://127.0.0.1:<port>/token GRAPH_ENDPOINT=http://127.0.0.1:<port>/v1.0
+
+
+class GraphStubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length', 0))
+        raw_body = self.rfile.read(length)
+        with server.lock:
+            server.requests.append((self.path, raw_body))
+            if server.fail_next > 0:
+                server.fail_next -= 1
+                return self._reply(503, {'error': {'code': 'ServiceUnavailable'}})
+
+        if self.path == '/token':
+            form = parse_qs(raw_body.decode('utf-8'))
+            with server.lock:
+                server.token_count += 1
+                token_number = server.token_count
+            return self._reply(200, {
+                'token_type': 'Bearer',
+                'expires_in': server.expires_in,
+                'access_token': f'stub-access-{token_number}',
+                'refresh_token': f"{form.get('refresh_token', ['stub'])[0]}-r{token_number}",
+            })
+        if self.path == '/v1.0/me/sendMail':
+            with server.lock:
+                server.sent.append(json.loads(raw_body))
+            return self._reply(202, None)
+        if self.path == '/v1.0/$batch':
+            responses = []
+            with server.lock:
+                for item in json.loads(raw_body)['requests']:
+                    server.sent.append(item['body'])
+                    responses.append({'id': item['id'], 'status': 202, 'headers': {}, 'body': None})
+            return self._reply(200, {'responses': responses})
+        return self._reply(404, {'error': {'code': 'NotFound'}})
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(host='127.0.0.1', port=0, expires_in=3600):
+    server = ThreadingHTTPServer((host, port), GraphStubHandler)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.sent = []
+    server.token_count = 0
+    server.fail_next = 0  # Set to make the next N requests fail with 503
+    server.expires_in = expires_in
+    server.base_url = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    stub = start_stub(port=8025)
+    print(f"TOKEN_URL={stub.base_url}/token")
+    print(f"GRAPH_ENDPOINT={stub.base_url}/v1.0")
+    threading.Event().wait()
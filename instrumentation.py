@@ -0,0 +1,144 @@
+from contextvars import ContextVar
+from flask import request, has_request_context, template_rendered, before_render_template
+from sqlalchemy import event
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Off by default; when both are off no listeners are registered at all
+REQUEST_TIMING_ENABLED = os.environ.get('REQUEST_TIMING_ENABLED', '0') == '1'
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 0))  # 0 disables the slow-query log
+
+# Timings of the request being handled in this thread, None outside instrumented requests
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    __slots__ = ('started', 'queries', 'db', 'templates', 'template', 'template_started', 'http_calls', 'http')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.templates = 0
+        self.template = 0.0
+        self.template_started = None
+        self.http_calls = 0
+        self.http = 0.0
+
+    def server_timing(self, total):
+        return (f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries", '
+                f'tpl;dur={self.template * 1000:.1f}, '
+                f'http;dur={self.http * 1000:.1f};desc="{self.http_calls} calls", '
+                f'total;dur={total * 1000:.1f}')
+
+
+def redact_parameters(parameters):
+    # Only the shape of the parameters is logged, never the values (passwords, emails, message bodies)
+    if isinstance(parameters, (list, tuple)) and parameters and isinstance(parameters[0], (list, tuple, dict)):
+        return f"<{len(parameters)} parameter sets>"
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    return [type(value).__name__ for value in parameters or ()]
+
+
+def init_query_events(engine, slow_query_ms=SLOW_QUERY_MS, track_requests=REQUEST_TIMING_ENABLED):
+    if not slow_query_ms and not track_requests:
+        return
+    slow_query_seconds = slow_query_ms / 1000
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        timings = _current.get()
+        if timings is not None:
+            timings.queries += 1
+            timings.db += elapsed
+        if slow_query_seconds and elapsed >= slow_query_seconds:
+            logger.warning(json.dumps({
+                'event': 'slow_query',
+                'duration_ms': round(elapsed * 1000, 1),
+                'statement': ' '.join(statement.split()),
+                'parameters': redact_parameters(parameters),
+                'path': request.path if has_request_context() else None,
+            }, ensure_ascii=False))
+
+    @event.listens_for(engine, 'handle_error')
+    def discard_query_timer(exception_context):
+        # A failed statement never reaches after_cursor_execute
+        connection = exception_context.connection
+        if connection is not None and connection.info.get('query_started'):
+            connection.info['query_started'].pop()
+
+
+def init_request_timing(app, http_session=None):
+    """Record query count, DB, template and outbound HTTP time for every request.
+
+    The totals are sent back in a ``Server-Timing`` header and logged as one JSON line
+    per request. Does nothing unless REQUEST_TIMING_ENABLED is set.
+    """
+    if not app.config.get('REQUEST_TIMING_ENABLED', REQUEST_TIMING_ENABLED):
+        return
+
+    @app.before_request
+    def start_request_timer():
+        _current.set(RequestTimings())
+
+    @app.after_request
+    def add_server_timing(response):
+        timings = _current.get()
+        if timings is None:
+            return response
+        total = time.perf_counter() - timings.started
+        response.headers.add('Server-Timing', timings.server_timing(total))
+        logger.info(json.dumps({
+            'event': 'request_timing',
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'db_ms': round(timings.db * 1000, 1),
+            'queries': timings.queries,
+            'template_ms': round(timings.template * 1000, 1),
+            'templates': timings.templates,
+            'http_ms': round(timings.http * 1000, 1),
+            'http_calls': timings.http_calls,
+        }))
+        return response
+
+    @app.teardown_request
+    def clear_request_timer(exc):
+        _current.set(None)
+
+    def start_template_timer(sender, template, context, **extra):
+        timings = _current.get()
+        if timings is not None:
+            timings.template_started = time.perf_counter()
+
+    def stop_template_timer(sender, template, context, **extra):
+        timings = _current.get()
+        if timings is not None and timings.template_started is not None:
+            timings.templates += 1
+            timings.template += time.perf_counter() - timings.template_started
+            timings.template_started = None
+
+    before_render_template.connect(start_template_timer, app, weak=False)
+    template_rendered.connect(stop_template_timer, app, weak=False)
+
+    if http_session is not None:
+        def record_http_call(response, *args, **kwargs):
+            timings = _current.get()
+            if timings is not None:
+                timings.http_calls += 1
+                timings.http += response.elapsed.total_seconds()
+            return response
+
+        http_session.hooks['response'].append(record_http_call)
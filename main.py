@@ -1,27 +1,49 @@
+# Measured from the very first import so the reported startup time covers everything below
+import time
+STARTUP_STARTED = time.perf_counter()
+
 from flask import Flask, render_template, request, redirect, url_for, flash, session, abort, g, send_from_directory, \
-    jsonify
+    jsonify, make_response
 from flask_bootstrap import Bootstrap5
-from flask_wtf.csrf import CSRFProtect, generate_csrf
+from jinja2 import FileSystemBytecodeCache
+from flask_wtf.csrf import CSRFProtect
+from flask.sessions import SecureCookieSessionInterface
 from functools import wraps
-from datetime import datetime
+from datetime import datetime, timezone
 import os
-from O365 import Account, FileSystemTokenBackend
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
+from werkzeug.utils import safe_join
 from form import ContactForm, RegisterForm, LoginForm, CreatePostForm, CommentForm
 from dotenv import load_dotenv
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_ckeditor import CKEditor, upload_success, upload_fail
-from database import User, Contact, db, DATABASE_URL, BlogPost, Comment
+from database import User, Contact, db, DATABASE_URL, BlogPost, Comment, engine_options, init_engine_events, \
+    pool_stats, repair_post_counters, delete_posts
 from flask_migrate import Migrate
 from email.mime.text import MIMEText
-from email_utils import send_message_email
+from outbox import enqueue_email
 import logging
-from sqlalchemy.sql import text
+from page_cache import PageCache, CachedPage
+from compression import CompressionMiddleware, compress_variants, negotiate_encoding
+from pagination import KeysetPage, encode_cursor, decode_cursor
+from user_cache import user_cache
+from search import create_search_backend
+from static_assets import init_static_assets, load_manifest
+from uploads import store_upload, schedule_variants, webp_alternative, responsive_images, HASHED_NAME
+from instrumentation import init_query_events, init_request_timing
+from email_utils import http as graph_http
+from replicas import replica_binds, choose_replica, recently_wrote, init_replica_events, replica_health, \
+    RoutingSession
+from sqlalchemy import event
+from queries import latest_posts, listing_query, comments_with_authors, post_watermark, listing_watermark, \
+    POST_FIELDS, POST_LIST_FIELDS, COMMENT_FIELDS, parse_fields, parse_since, api_posts_query, api_comments_query, \
+    row_to_dict
 import hashlib
+import json
+import mimetypes
 
 # Configure logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
 logger = logging.getLogger(__name__)
 
 # Load environment variables
@@ -32,13 +54,50 @@ app = Flask(__name__)
 csrf = CSRFProtect(app)
 app.secret_key = os.environ["FLASK_SECRET_KEY"]
 ckeditor = CKEditor(app)
+init_static_assets(app)
 app.config['CKEDITOR_FILE_UPLOADER'] = 'upload'
 bootstrap = Bootstrap5(app)
 app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_POOL_RECYCLE'] = 28000  # Recycle connections every 28000 seconds
-app.config['SQLALCHEMY_POOL_TIMEOUT'] = 20  # Timeout for getting a connection from the pool
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options()  # Pool sizing is configured through DB_POOL_* env vars
+app.config['SQLALCHEMY_BINDS'] = replica_binds()  # Read replicas from DATABASE_REPLICA_URLS
 app.config['UPLOAD_FOLDER'] = 'uploads'
+# How /uploads is served: '' (Python streams the file), 'x-sendfile' (Apache/lighttpd) or
+# 'x-accel' (nginx, with an internal location mapping UPLOAD_ACCEL_PREFIX to the upload folder)
+app.config['UPLOAD_SENDFILE_MODE'] = os.environ.get('UPLOAD_SENDFILE_MODE', '')
+app.config['UPLOAD_ACCEL_PREFIX'] = os.environ.get('UPLOAD_ACCEL_PREFIX', '/protected-uploads/')
+app.config['USE_X_SENDFILE'] = app.config['UPLOAD_SENDFILE_MODE'] == 'x-sendfile'
+UPLOAD_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+UPLOAD_MAX_AGE = 3600
+app.config['PAGE_CACHE_ENABLED'] = os.environ.get('PAGE_CACHE_ENABLED', '1') == '1'
+app.config['PAGE_CACHE_PATH'] = os.environ.get('PAGE_CACHE_PATH', 'page_cache.sqlite3')
+app.config['PAGE_CACHE_MAX_ENTRIES'] = int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', 500))
+app.config['PAGE_CACHE_TTL'] = int(os.environ.get('PAGE_CACHE_TTL', 300))  # Seconds
+app.config['FEED_CACHE_TTL'] = int(os.environ.get('FEED_CACHE_TTL', 24 * 3600))  # Seconds; posts changes evict sooner
+FEED_SIZE = 20
+app.config['COMPRESSION_ENABLED'] = os.environ.get('COMPRESSION_ENABLED', '1') == '1'
+app.config['COMPRESSION_MIN_SIZE'] = int(os.environ.get('COMPRESSION_MIN_SIZE', 500))  # Bytes
+# Per-request query/template/Graph timings (Server-Timing header + JSON log line) and slow-query log
+app.config['REQUEST_TIMING_ENABLED'] = os.environ.get('REQUEST_TIMING_ENABLED', '0') == '1'
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 0))  # 0 disables the slow-query log
+# How long shared caches (a CDN or reverse proxy) may serve cookie-free anonymous pages; 0 disables
+app.config['PUBLIC_CACHE_MAX_AGE'] = int(os.environ.get('PUBLIC_CACHE_MAX_AGE', 60))  # Seconds
+PUBLIC_ENDPOINTS = {'home', 'get_blog', 'about', 'show_post', 'api_posts', 'api_post', 'api_post_comments'}
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+API_PAGE_ARGS = ('fields', 'since', 'limit')  # Query parameters kept in next/prev links
+
+
+class CookieFreeSessionInterface(SecureCookieSessionInterface):
+    # Visitors without a session cookie whose session stayed empty get neither a Set-Cookie
+    # nor Vary: Cookie, so their pages can be shared. Everyone else is handled as before.
+    def save_session(self, app, session, response):
+        if not session and self.get_cookie_name(app) not in request.cookies:
+            return
+        super().save_session(app, session, response)
+
+
+app.session_interface = CookieFreeSessionInterface()
 
 
 # Ensure the upload directory exists
@@ -52,24 +111,71 @@ def ensure_upload_directory_exists():
             raise
 
 
-ensure_upload_directory_exists()
+# Compress HTML/JSON responses unless a proxy in front already does it
+if app.config['COMPRESSION_ENABLED']:
+    app.wsgi_app = CompressionMiddleware(app.wsgi_app, min_size=app.config['COMPRESSION_MIN_SIZE'])
+
+# Rendered-page cache shared by all workers through a SQLite file
+page_cache = PageCache(app.config['PAGE_CACHE_PATH'], max_entries=app.config['PAGE_CACHE_MAX_ENTRIES'],
+                       ttl=app.config['PAGE_CACHE_TTL'])
+
+
+
+# Pages made stale by model events (renamed or deleted users, see database.mark_pages_stale)
+@event.listens_for(RoutingSession, 'after_commit')
+def invalidate_stale_pages(db_session):
+    tags = db_session.info.pop('stale_pages', None)
+    if tags:
+        page_cache.invalidate(*tags)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def forget_stale_pages(db_session):
+    db_session.info.pop('stale_pages', None)
+
 
 db.init_app(app)
+with app.app_context():
+    for engine in db.engines.values():
+        init_engine_events(engine)
+        init_query_events(engine, slow_query_ms=app.config['SLOW_QUERY_MS'],
+                          track_requests=app.config['REQUEST_TIMING_ENABLED'])
+    init_replica_events(db.engines)
+init_request_timing(app, graph_http)
 migrate = Migrate(app, db)
+search_index = create_search_backend()
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
-# Email configuration
-my_email = os.environ["MY_EMAIL"]
-client_id = os.environ['CLIENT_365_ID']
-client_secret = os.environ['CLIENT_365_SECRET']
-tenant_id = os.environ['TENANT_365_ID']
-redirect_uri = os.environ['REDIRECT_URI']
-token_backend = FileSystemTokenBackend(token_path='.', token_filename='o365_token.txt')
-credentials = (client_id, client_secret)
-
-account = Account(credentials, token_backend=token_backend)
+# Compiled templates are cached on disk and shared by all workers on the host. The cache holds
+# code that gets loaded, so it must be private to this user: by default Jinja's own per-user
+# 0700 directory, or JINJA_CACHE_DIR, which is created 0700 and refused if anyone else can use it.
+app.config['JINJA_CACHE_DIR'] = os.environ.get('JINJA_CACHE_DIR')
+app.config['PREWARM_TEMPLATES'] = os.environ.get('PREWARM_TEMPLATES', '0') == '1'
+if app.config['JINJA_CACHE_DIR']:
+    os.makedirs(app.config['JINJA_CACHE_DIR'], mode=0o700, exist_ok=True)
+    cache_dir_stat = os.stat(app.config['JINJA_CACHE_DIR'])
+    if cache_dir_stat.st_uid != os.getuid() or cache_dir_stat.st_mode & 0o077:
+        raise RuntimeError(f"JINJA_CACHE_DIR {app.config['JINJA_CACHE_DIR']} must be owned by this user "
+                           f"and not accessible to others (chmod 700)")
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['JINJA_CACHE_DIR'])
+else:
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+
+
+# The O365 client is only needed by the Microsoft 365 auth routes, so it is built on first use
+_o365_account = None
+
+
+def get_o365_account():
+    global _o365_account
+    if _o365_account is None:
+        from O365 import Account, FileSystemTokenBackend
+        credentials = (os.environ['CLIENT_365_ID'], os.environ['CLIENT_365_SECRET'])
+        token_backend = FileSystemTokenBackend(token_path='.', token_filename='o365_token.txt')
+        _o365_account = Account(credentials, token_backend=token_backend)
+    return _o365_account
 
 
 # Gravatar function
@@ -80,6 +186,8 @@ def gravatar(email, size=100, default='identicon', rating='g'):
 
 
 app.jinja_env.filters['gravatar'] = gravatar
+# Post bodies: uploaded photos get a <picture> with their resized WebP variants
+app.jinja_env.filters['responsive_images'] = lambda html: responsive_images(html, app.config['UPLOAD_FOLDER'])
 
 
 # Admin-only decorator
@@ -93,30 +201,210 @@ def admin_only(f):
     return decorated_function
 
 
+# Read-only views: their SELECTs (and the user lookup) go to a healthy replica, unless this
+# visitor wrote something in the last REPLICA_STICKY_SECONDS. Must sit above decorators that
+# touch current_user or the database. Page cache misses are still rendered from the primary.
+def read_replica(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if request.method in ('GET', 'HEAD') and not recently_wrote():
+            db.session.info['replica'] = choose_replica(db.engines)
+        return f(*args, **kwargs)
+
+    return decorated_function
+
+
+def cache_variant():
+    if not current_user.is_authenticated:
+        return 'anon'
+    return 'admin' if current_user.id == 1 else 'user'
+
+
+def cached_page_response(cached):
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding'), cached.encodings)
+    response = make_response(cached.encodings[encoding] if encoding else cached.body)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if cached.encodings:
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+# Page cache decorator. Tags may reference view arguments, e.g. 'post:{post_id}'.
+# With anonymous_only the page is only cached for logged-out visitors (pages with per-session forms).
+# Under conditional_page an entry is only used while it was stored for the current watermark, so
+# the body can never be older than the ETag sent with it (even before the write invalidates it).
+def cached_page(*tags, anonymous_only=False):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            variant = cache_variant()
+            if (not app.config['PAGE_CACHE_ENABLED'] or request.method != 'GET'
+                    or (anonymous_only and variant != 'anon')):
+                return f(*args, **kwargs)
+            key = f"{variant}:{request.full_path}"
+            version = g.get('page_version')
+            cached = page_cache.get(key)
+            if cached is not None and cached.etag != version:
+                cached = None
+            if cached is None:
+                started = time.time()
+                # Stored pages outlive this request, so never fill them from a lagging replica
+                db.session.info['replica'] = None
+                rv = f(*args, **kwargs)
+                if not isinstance(rv, str):
+                    return rv
+                body = rv.encode('utf-8')
+                # Compressed once here and stored, so cache hits are never recompressed
+                cached = CachedPage(body, compress_variants(body, app.config['COMPRESSION_MIN_SIZE']), etag=version)
+                page_cache.set(key, cached, tags=[tag.format(**kwargs) for tag in tags], started=started)
+            return cached_page_response(cached)
+
+        return decorated_function
+
+    return decorator
+
+
+def template_version():
+    # Changes whenever a template does, so validators issued before a deploy stop matching
+    digest = hashlib.sha1()
+    for name in sorted(app.jinja_env.list_templates()):
+        path = os.path.join(app.root_path, app.template_folder, name)
+        if os.path.isfile(path):
+            digest.update(f"{name}:{os.stat(path).st_mtime_ns}".encode('utf-8'))
+    digest.update(json.dumps(load_manifest(app.static_folder), sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()[:12]
+
+
+TEMPLATE_VERSION = template_version()
+
+
+# Conditional GET decorator. `watermark` takes the view arguments and returns (version,
+# last_modified) from one cheap query, or None to fall through to the view (e.g. for a 404).
+# A matching If-None-Match/If-Modified-Since gets a 304 before any other query, render or
+# CSRF token; the ETag also covers who is looking, since pages differ per viewer (unless
+# per_viewer=False, for responses that are the same for everyone such as the JSON API).
+def conditional_page(watermark, per_viewer=True):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method != 'GET':
+                return f(*args, **kwargs)
+            mark = watermark(**kwargs)
+            if mark is None:
+                return f(*args, **kwargs)
+            version, last_modified = mark
+            # Lets cached_page check its entry against the same watermark
+            g.page_version = hashlib.sha1(repr(version).encode('utf-8')).hexdigest()[:32]
+            viewer = cache_variant() if per_viewer else 'all'
+            if per_viewer and current_user.is_authenticated:
+                # Logged-in pages carry a CSRF token; don't revalidate one older than half its lifetime
+                time_limit = app.config.get('WTF_CSRF_TIME_LIMIT', 3600) or 0
+                viewer += f":{current_user.id}:{int(time.time() // (time_limit / 2)) if time_limit else 0}"
+            etag = hashlib.sha1(repr((TEMPLATE_VERSION, viewer, request.full_path, version)).encode('utf-8')) \
+                .hexdigest()[:32]
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            else:
+                not_modified = (request.if_modified_since is not None
+                                and last_modified.replace(microsecond=0) <= request.if_modified_since)
+            if not_modified:
+                response = make_response('', 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            # The 304 carries the 200's caching headers, so shared caches keep one validator per
+            # encoding (a body under COMPRESSION_MIN_SIZE still gets Vary, as a later larger one would)
+            response.vary.add('Accept-Encoding')
+            response.set_etag(etag, weak=True)
+            response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            if viewer not in ('anon', 'all'):
+                response.cache_control.private = True
+            return response
+
+        return decorated_function
+
+    return decorator
+
+
+# Cache decorator for the feed and sitemap: stored until a post is added, edited or deleted
+# (tag 'feed'), with ETag/Last-Modified answered from the cache entry so polls that get a
+# 304 never touch the database. The view returns the document and its last-modified time.
+def cached_document(mimetype):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function():
+            key = f"doc:{request.host}{request.path}"
+            cached = page_cache.get(key) if app.config['PAGE_CACHE_ENABLED'] else None
+            if cached is None:
+                started = time.time()
+                db.session.info['replica'] = None  # As in cached_page: cached documents come from the primary
+                document, last_modified = f()
+                body = document.encode('utf-8')
+                cached = CachedPage(body, compress_variants(body, app.config['COMPRESSION_MIN_SIZE']),
+                                    etag=hashlib.sha256(body).hexdigest()[:32],
+                                    last_modified=last_modified.replace(tzinfo=timezone.utc).timestamp())
+                if app.config['PAGE_CACHE_ENABLED']:
+                    page_cache.set(key, cached, tags=['feed'], started=started, ttl=app.config['FEED_CACHE_TTL'])
+            response = cached_page_response(cached)
+            response.mimetype = mimetype
+            # Weak, since the same validator covers the gzip/br/identity encodings
+            response.set_etag(cached.etag, weak=True)
+            response.last_modified = datetime.fromtimestamp(cached.last_modified, timezone.utc)
+            response.cache_control.public = True
+            response.cache_control.max_age = 300
+            return response.make_conditional(request)
+
+        return decorated_function
+
+    return decorator
+
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    user = user_cache.get(user_id)
+    if user is None:
+        db_user = db.session.get(User, user_id)
+        if db_user is None:
+            return None
+        user = user_cache.put(db_user)
+    return user
 
 
 @app.context_processor
 def inject_user():
     year = datetime.now().year
-    return dict(logged_in=current_user.is_authenticated, year=year, csrf_token=generate_csrf())
-
-
-@app.before_request
-def set_mysql_timeout():
-    if not hasattr(g, 'mysql_timeout_set'):
-        with db.engine.connect() as connection:
-            connection.execute(text("SET SESSION wait_timeout = 28800"))
-            connection.execute(text("SET SESSION interactive_timeout = 28800"))
-        g.mysql_timeout_set = True
+    return dict(logged_in=current_user.is_authenticated, year=year)
+
+
+@app.after_request
+def public_cache_headers(response):
+    # Anonymous GETs of public pages that set no cookie are the same for every such visitor, so
+    # shared caches may keep them for PUBLIC_CACHE_MAX_AGE; browsers still revalidate each time.
+    # A CDN in front must bypass its cache for requests carrying the session or remember cookie.
+    cookies = (app.config['SESSION_COOKIE_NAME'], app.config.get('REMEMBER_COOKIE_NAME', 'remember_token'))
+    if (not app.config['PUBLIC_CACHE_MAX_AGE'] or request.method not in ('GET', 'HEAD')
+            or request.endpoint not in PUBLIC_ENDPOINTS or response.status_code not in (200, 304)
+            or session or any(name in request.cookies for name in cookies) or 'Set-Cookie' in response.headers):
+        return response
+    response.cache_control.no_cache = None
+    response.cache_control.private = None
+    response.cache_control.public = True
+    response.cache_control.max_age = 0
+    response.cache_control.s_maxage = app.config['PUBLIC_CACHE_MAX_AGE']
+    return response
 
 
 @app.route("/")
+@read_replica
+@conditional_page(listing_watermark)
+@cached_page('posts')
 def home():
-    latest_posts = BlogPost.query.order_by(BlogPost.id.desc()).limit(10).all()
-    return render_template("index.html", all_posts=latest_posts)
+    return render_template("index.html", all_posts=latest_posts(10))
 
 
 @app.route('/about')
@@ -125,59 +413,170 @@ def about():
 
 
 @app.route("/blog")
+@read_replica
+@conditional_page(listing_watermark)
+@cached_page('posts')
 def get_blog():
-    page = request.args.get('page', 1, type=int)
     per_page = 10
-    paginated_posts = db.session.query(BlogPost, User.first_name, User.last_name).join(User,
-                                                                                       BlogPost.author_id == User.id).order_by(
-        BlogPost.id.desc()).paginate(page=page, per_page=per_page, error_out=False)
-
-    posts_data = [{
-        'post': post,
-        'author_first_name': first_name,
-        'author_last_name': last_name
-    } for post, first_name, last_name in paginated_posts.items]
+    # Old ?page=N links are redirected to the equivalent cursor URL. Temporarily (302): the cursor
+    # for page N moves as posts are added, so browsers and crawlers must not remember it.
+    page = request.args.get('page', type=int)
+    if page is not None:
+        if page <= 1:
+            return redirect(url_for('get_blog'))
+        last_id_on_prev_page = db.session.query(BlogPost.id).order_by(BlogPost.id.desc()).offset(
+            (page - 1) * per_page - 1).limit(1).scalar()
+        if last_id_on_prev_page is None:
+            return redirect(url_for('get_blog'))
+        return redirect(url_for('get_blog', after=encode_cursor(last_id_on_prev_page)))
+
+    after = decode_cursor(request.args.get('after'))
+    before = decode_cursor(request.args.get('before'))
+    keyset_page = KeysetPage(listing_query(), BlogPost.id, per_page, after=after, before=before)
+    if not keyset_page.items and (after or before):
+        return redirect(url_for('get_blog'))
 
-    next_url = url_for('get_blog', page=paginated_posts.next_num) if paginated_posts.has_next else None
-    prev_url = url_for('get_blog', page=paginated_posts.prev_num) if paginated_posts.has_prev else None
+    next_url = url_for('get_blog', after=keyset_page.next_cursor) if keyset_page.next_cursor else None
+    prev_url = url_for('get_blog', before=keyset_page.prev_cursor) if keyset_page.prev_cursor else None
 
-    return render_template("blog.html", all_posts=posts_data, next_url=next_url, prev_url=prev_url)
+    return render_template("blog.html", all_posts=keyset_page.items, next_url=next_url, prev_url=prev_url)
 
 
 @app.route("/blog/post/<int:post_id>", methods=['GET', 'POST'])
+@read_replica
+@conditional_page(post_watermark)
+@cached_page('post:{post_id}', anonymous_only=True)
 def show_post(post_id):
-    post_with_author = db.session.query(BlogPost, User.first_name, User.last_name).join(User,
-                                                                                        BlogPost.author_id == User.id).filter(
-        BlogPost.id == post_id).first()
-    if not post_with_author:
+    post = db.session.get(BlogPost, post_id)
+    if not post:
         return "Post not found", 404
-    post, author_first_name, author_last_name = post_with_author
-    comment_form = CommentForm()
-    if comment_form.validate_on_submit() and current_user.is_authenticated:
+    # Only logged-in visitors see the comment form, so anonymous views never mint a CSRF token
+    comment_form = CommentForm() if current_user.is_authenticated else None
+    if comment_form is not None and comment_form.validate_on_submit():
         new_comment = Comment(
             text=comment_form.comment_text.data,
             author_id=current_user.id,
             post_id=post.id
         )
         db.session.add(new_comment)
-        db.session.commit()
-
-        # Send email notification
-        send_message_email(
+        # Email notification is queued in the same transaction and sent by the outbox worker
+        enqueue_email(
             name=current_user.username,
             email=current_user.email,
-            message=f"A new comment was posted by {current_user.username} on the post '{post.title}':\n\n{new_comment.text}"
+            message=f"A new comment was posted by {current_user.username} on the post '{post.title}':\n\n{new_comment.text}",
+            digest_key=f"comment:post:{post.id}"
         )
-        flash("Comment posted successfully and email notification sent.")
+        db.session.commit()
+        page_cache.invalidate('posts', f'post:{post.id}')  # Listings show the comment count
+        flash("Comment posted successfully and email notification queued.")
         return redirect(url_for('show_post', post_id=post.id))
 
-    comments = Comment.query.filter_by(post_id=post.id).all()
-    post_data = {
-        'post': post,
-        'author_first_name': author_first_name,
-        'author_last_name': author_last_name
+    comments = comments_with_authors(post.id)
+    return render_template("post.html", post=post, form=comment_form, comments=comments)
+
+
+@app.route("/search")
+@read_replica
+def search():
+    query = request.args.get('q', '').strip()[:100]
+    posts = []
+    if query:
+        post_ids = search_index.search(query, limit=30)
+        rows = {post.id: post for post in listing_query().filter(BlogPost.id.in_(post_ids)).all()} if post_ids else {}
+        posts = [rows[post_id] for post_id in post_ids if post_id in rows]
+    return render_template("search.html", query=query, all_posts=posts)
+
+
+@app.route('/feed.xml')
+@read_replica
+@cached_document('application/atom+xml')
+def feed():
+    posts = listing_query().order_by(BlogPost.id.desc()).limit(FEED_SIZE).all()
+    updated = max((post.last_edited or post.date for post in posts), default=datetime(2024, 1, 1))
+    return render_template('feed.xml', posts=posts, updated=updated), updated
+
+
+@app.route('/sitemap.xml')
+@read_replica
+@cached_document('application/xml')
+def sitemap():
+    posts = db.session.query(BlogPost.id, BlogPost.date, BlogPost.last_edited).order_by(BlogPost.id.desc()).all()
+    updated = max((last_edited or date for _, date, last_edited in posts), default=datetime(2024, 1, 1))
+    return render_template('sitemap.xml', posts=posts), updated
+
+
+@app.route('/robots.txt')
+def robots_txt():
+    with open(os.path.join(app.root_path, 'robots.txt')) as f:
+        rules = f.read()
+    response = make_response(f"{rules.rstrip()}\n\nSitemap: {url_for('sitemap', _external=True)}\n")
+    response.mimetype = 'text/plain'
+    return response
+
+
+# Read-only JSON API. Lists are newest first with opaque ?after=/?before= cursors, ?fields=
+# picks columns (lists leave out body unless asked), and ?since= (ISO 8601) limits posts to
+# those added or edited after it, so syndication jobs can pull only what changed.
+
+def api_error(message, status=400):
+    return jsonify(error=message), status
+
+
+def api_page_size():
+    return min(max(request.args.get('limit', API_PAGE_SIZE, type=int), 1), API_MAX_PAGE_SIZE)
+
+
+def api_page(query, column, endpoint, **values):
+    keyset_page = KeysetPage(query, column, api_page_size(),
+                             after=decode_cursor(request.args.get('after')),
+                             before=decode_cursor(request.args.get('before')))
+    # Only the API's own parameters are carried over; the view arguments always win
+    values = {**{name: request.args[name] for name in API_PAGE_ARGS if name in request.args}, **values}
+    return {
+        'items': [row_to_dict(row) for row in keyset_page.items],
+        'next': url_for(endpoint, **values, after=keyset_page.next_cursor) if keyset_page.next_cursor else None,
+        'prev': url_for(endpoint, **values, before=keyset_page.prev_cursor) if keyset_page.prev_cursor else None,
     }
-    return render_template("post.html", post=post, post_data=post_data, form=comment_form, comments=comments)
+
+
+@app.route('/api/posts')
+@read_replica
+@conditional_page(listing_watermark, per_viewer=False)
+def api_posts():
+    try:
+        fields = parse_fields(request.args.get('fields'), POST_FIELDS, POST_LIST_FIELDS)
+        since = parse_since(request.args.get('since'))
+    except ValueError as e:
+        return api_error(str(e))
+    return jsonify(api_page(api_posts_query(fields, since), BlogPost.id, 'api_posts'))
+
+
+@app.route('/api/posts/<int:post_id>')
+@read_replica
+@conditional_page(post_watermark, per_viewer=False)
+def api_post(post_id):
+    try:
+        fields = parse_fields(request.args.get('fields'), POST_FIELDS, POST_FIELDS)
+    except ValueError as e:
+        return api_error(str(e))
+    row = api_posts_query(fields).filter(BlogPost.id == post_id).first()
+    if row is None:
+        return api_error("Post not found", 404)
+    return jsonify(row_to_dict(row))
+
+
+@app.route('/api/posts/<int:post_id>/comments')
+@read_replica
+@conditional_page(post_watermark, per_viewer=False)
+def api_post_comments(post_id):
+    try:
+        fields = parse_fields(request.args.get('fields'), COMMENT_FIELDS, COMMENT_FIELDS)
+    except ValueError as e:
+        return api_error(str(e))
+    if db.session.query(BlogPost.id).filter(BlogPost.id == post_id).scalar() is None:
+        return api_error("Post not found", 404)
+    return jsonify(api_page(api_comments_query(post_id, fields), Comment.id, 'api_post_comments',
+                            post_id=post_id))
 
 
 @app.route("/new-post", methods=["GET", "POST"])
@@ -197,6 +596,8 @@ def add_new_post():
         try:
             db.session.add(new_post)
             db.session.commit()
+            page_cache.invalidate('posts', 'feed')
+            search_index.index_post(new_post)
             flash("Post added successfully!")
             return redirect(url_for("get_blog"))
         except Exception as e:
@@ -221,6 +622,8 @@ def edit_post(post_id):
         post.last_edited = datetime.now()  # Update the last edited date
         try:
             db.session.commit()
+            page_cache.invalidate('posts', 'feed', f'post:{post.id}')
+            search_index.index_post(post)
             return redirect(url_for("show_post", post_id=post.id))
         except Exception as e:
             db.session.rollback()
@@ -232,13 +635,15 @@ def edit_post(post_id):
 @app.route("/blog/delete/<int:post_id>")
 @admin_only
 def delete_post(post_id):
-    post_to_delete = db.session.get(BlogPost, post_id)
-    if not post_to_delete:
-        flash("投稿が見つかりませんでした。")
-        return redirect(url_for('get_blog'))
     try:
-        db.session.delete(post_to_delete)
+        # Neither the post nor its comments are loaded; the database cascades to the comments
+        if not delete_posts([post_id]):
+            db.session.rollback()
+            flash("投稿が見つかりませんでした。")
+            return redirect(url_for('get_blog'))
         db.session.commit()
+        page_cache.invalidate('posts', 'feed', f'post:{post_id}')
+        search_index.remove_post(post_id)
         flash("投稿が正常に削除されました。")
     except Exception as e:
         db.session.rollback()
@@ -258,11 +663,11 @@ def contact():
                 message=form.message.data
             )
             db.session.add(new_contact)
+            enqueue_email(form.name.data, form.email.data, form.message.data,
+                          digest_key=f"contact:{form.email.data.lower()}")
             db.session.commit()
             flash('メッセージを送信しました！')
             print(f"Form Data: {form.name.data}, {form.email.data}, {form.message.data}")
-            send_message_email(form.name.data, form.email.data, form.message.data)
-            print("Email sent successfully!")
             return redirect(url_for('contact_success'))
         else:
             print("Form not validated:", form.errors)
@@ -332,9 +737,9 @@ def logout():
 
 @app.route('/start-auth')
 def start_auth():
-    auth_url, state = account.con.get_authorization_url(
+    auth_url, state = get_o365_account().con.get_authorization_url(
         requested_scopes=['offline_access', 'User.Read', 'Mail.ReadWrite', 'Mail.Send'],
-        redirect_uri=redirect_uri
+        redirect_uri=os.environ['REDIRECT_URI']
     )
     session['oauth_state'] = state
     return redirect(auth_url)
@@ -347,13 +752,7 @@ def oauth_callback():
     if code:
         logger.debug(f"Received OAuth callback with code: {code}")
 
-        credentials = (os.environ['CLIENT_365_ID'], os.environ['CLIENT_365_SECRET'])
-        token_backend = FileSystemTokenBackend(token_path='.', token_filename='o365_token.txt')
-
-        # Create the Account instance with the token backend
-        account = Account(credentials, token_backend=token_backend)
-
-        if account.authenticate(code=code, redirect_uri=redirect_uri):
+        if get_o365_account().authenticate(code=code, redirect_uri=os.environ['REDIRECT_URI']):
             logger.debug("Account is authenticated.")
             flash('You have been successfully authenticated with Microsoft 365.')
             return redirect(url_for('home'))
@@ -367,6 +766,55 @@ def oauth_callback():
         return redirect(url_for('home'))
 
 
+@app.route('/admin/posts')
+@login_required
+@admin_only
+def admin_posts():
+    keyset_page = KeysetPage(listing_query(), BlogPost.id, 50, after=decode_cursor(request.args.get('after')))
+    next_url = url_for('admin_posts', after=keyset_page.next_cursor) if keyset_page.next_cursor else None
+    return render_template('admin-posts.html', posts=keyset_page.items, next_url=next_url)
+
+
+@app.route('/admin/posts/delete', methods=['POST'])
+@login_required
+@admin_only
+def bulk_delete_posts():
+    post_ids = request.form.getlist('post_ids', type=int)
+    if not post_ids:
+        flash("削除する投稿を選択してください。")
+        return redirect(url_for('admin_posts'))
+    try:
+        deleted = delete_posts(post_ids)
+        db.session.commit()
+        page_cache.invalidate('posts', 'feed', *(f'post:{post_id}' for post_id in post_ids))
+        for post_id in post_ids:
+            search_index.remove_post(post_id)
+        flash(f"{deleted}件の投稿を削除しました。")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error deleting posts: {e}")
+        flash("投稿の削除中にエラーが発生しました。もう一度お試しください。")
+    return redirect(url_for('admin_posts'))
+
+
+@app.route('/admin/pool-stats')
+@login_required
+@admin_only
+def pool_stats_view():
+    # Per-worker connection pool usage, for sizing the pool against gunicorn workers
+    stats = pool_stats.snapshot(db.engine.pool)
+    stats['replicas'] = replica_health.snapshot()
+    return jsonify(stats)
+
+
+@app.cli.command('repair-counters')
+def repair_counters_command():
+    """Recompute blog_posts.comment_count and author_name from comments and users."""
+    repaired = repair_post_counters()
+    page_cache.invalidate('posts', 'feed')
+    print(f"Repaired counters on {repaired} posts")
+
+
 @app.route('/error')
 def error_page():
     return render_template('error.html')
@@ -379,19 +827,62 @@ def upload():
     f = request.files.get('upload')
     if not f:
         return upload_fail(message='No file uploaded')  # Customizable error message
-    filename = secure_filename(f.filename)
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    f.save(filepath)
+    ensure_upload_directory_exists()
+    # Stored under its content hash; resized/WebP variants are generated in the background
+    filename, created = store_upload(f, app.config['UPLOAD_FOLDER'])
+    if created:
+        schedule_variants(os.path.join(app.config['UPLOAD_FOLDER'], filename))
     url = url_for('uploaded_files', filename=filename)
     return upload_success(url=url)  # Respond with the URL of the uploaded file
 
 
 @app.route('/uploads/<filename>')
 def uploaded_files(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    # Content-hashed names never change content, so they can be cached forever and the hash is the ETag
+    hashed = HASHED_NAME.match(filename)
+    # Browsers that take WebP get the generated copy of a JPEG/PNG under the original's URL
+    webp = webp_alternative(filename, app.config['UPLOAD_FOLDER']) if hashed else None
+    if webp and 'image/webp' in request.headers.get('Accept', ''):
+        filename = webp
+    mode = app.config['UPLOAD_SENDFILE_MODE']
+    if mode == 'x-accel':
+        # nginx serves the bytes (ranges and conditional requests included) from an internal location
+        upload_dir = os.path.join(app.root_path, app.config['UPLOAD_FOLDER'])
+        path = safe_join(upload_dir, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        response = make_response('')
+        response.headers['X-Accel-Redirect'] = app.config['UPLOAD_ACCEL_PREFIX'] + filename
+        response.headers['Content-Type'] = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    else:
+        # send_file handles If-None-Match/If-Modified-Since (304) and Range (206); with
+        # USE_X_SENDFILE it only emits the X-Sendfile header
+        response = send_from_directory(app.config['UPLOAD_FOLDER'], filename, conditional=True,
+                                       etag=filename.replace('.', '-') if hashed else True,
+                                       max_age=UPLOAD_IMMUTABLE_MAX_AGE if hashed else UPLOAD_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.max_age = UPLOAD_IMMUTABLE_MAX_AGE if hashed else UPLOAD_MAX_AGE
+    if hashed:
+        response.cache_control.immutable = True
+    if webp:
+        response.vary.add('Accept')
+    return response
+
+
+def prewarm_templates():
+    # Compile every page template now instead of on the first request each worker serves
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(name)
+
+
+if app.config['PREWARM_TEMPLATES']:
+    prewarm_templates()
+
+app.config['STARTUP_SECONDS'] = time.perf_counter() - STARTUP_STARTED
+logger.info(f"Application initialised in {app.config['STARTUP_SECONDS'] * 1000:.1f} ms (pid {os.getpid()})")
 
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        db.create_all(bind_key=None)  # Replicas get their schema through replication
     app.run(debug=True)
@@ -0,0 +1,38 @@
+"""Add excerpt and reading time to blog posts
+
+Revision ID: 3f9c2d8e1a47
+Revises: a21256e90391
+Create Date: 2026-10-18 09:12:04.118302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from text_utils import html_to_text, make_excerpt, reading_time_minutes
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c2d8e1a47'
+down_revision = 'a21256e90391'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('blog_posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('excerpt', sa.String(length=300), nullable=True))
+        batch_op.add_column(sa.Column('reading_time', sa.Integer(), nullable=True))
+
+    # Backfill existing posts
+    conn = op.get_bind()
+    posts = sa.table('blog_posts', sa.column('id', sa.Integer), sa.column('body', sa.Text),
+                     sa.column('excerpt', sa.String), sa.column('reading_time', sa.Integer))
+    for post_id, body in conn.execute(sa.select(posts.c.id, posts.c.body)).all():
+        body_text = html_to_text(body)
+        conn.execute(posts.update().where(posts.c.id == post_id).values(
+            excerpt=make_excerpt(body_text), reading_time=reading_time_minutes(body_text)))
+
+
+def downgrade():
+    with op.batch_alter_table('blog_posts', schema=None) as batch_op:
+        batch_op.drop_column('reading_time')
+        batch_op.drop_column('excerpt')
@@ -0,0 +1,41 @@
+"""Add search text and fulltext index to blog posts
+
+Revision ID: 5e0b7c3a9d21
+Revises: d27a9e5b3c18
+Create Date: 2026-10-18 13:20:52.664180
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from text_utils import html_to_text
+
+
+# revision identifiers, used by Alembic.
+revision = '5e0b7c3a9d21'
+down_revision = 'd27a9e5b3c18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('blog_posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('search_text', sa.Text(), nullable=True))
+
+    # Backfill existing posts
+    conn = op.get_bind()
+    posts = sa.table('blog_posts', sa.column('id', sa.Integer), sa.column('body', sa.Text),
+                     sa.column('search_text', sa.Text))
+    for post_id, body in conn.execute(sa.select(posts.c.id, posts.c.body)).all():
+        conn.execute(posts.update().where(posts.c.id == post_id).values(search_text=html_to_text(body)))
+
+    # Only used with SEARCH_BACKEND=mysql; the ngram parser tokenizes Japanese
+    if conn.dialect.name == 'mysql':
+        op.execute("CREATE FULLTEXT INDEX ft_blog_posts_search ON blog_posts (title, subtitle, search_text) "
+                   "WITH PARSER ngram")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'mysql':
+        op.drop_index('ft_blog_posts_search', table_name='blog_posts')
+    with op.batch_alter_table('blog_posts', schema=None) as batch_op:
+        batch_op.drop_column('search_text')
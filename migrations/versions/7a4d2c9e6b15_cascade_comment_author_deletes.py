@@ -0,0 +1,42 @@
+"""Cascade comment deletes from their author
+
+Revision ID: 7a4d2c9e6b15
+Revises: e91b5d7c4f08
+Create Date: 2026-10-18 17:21:40.118302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a4d2c9e6b15'
+down_revision = 'e91b5d7c4f08'
+branch_labels = None
+depends_on = None
+
+FK_NAME = 'fk_comments_author_id_users'
+
+
+def author_fk_name():
+    # The initial migration left the constraint unnamed, so look up what the database called it
+    for fk in sa.inspect(op.get_bind()).get_foreign_keys('comments'):
+        if fk['constrained_columns'] == ['author_id']:
+            return fk['name']
+    return None
+
+
+def upgrade():
+    # Deleting a user (or post) now removes their comments in the database, so the ORM
+    # never loads them (passive_deletes on the relationships)
+    existing = author_fk_name()
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        if existing:
+            batch_op.drop_constraint(existing, type_='foreignkey')
+        batch_op.create_foreign_key(FK_NAME, 'users', ['author_id'], ['id'], ondelete='CASCADE')
+
+
+def downgrade():
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.drop_constraint(FK_NAME, type_='foreignkey')
+        batch_op.create_foreign_key(None, 'users', ['author_id'], ['id'])
@@ -0,0 +1,27 @@
+"""Add blog_posts date index
+
+Revision ID: b5e8f1a3c722
+Revises: 7a4d2c9e6b15
+Create Date: 2026-10-18 18:05:27.640193
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e8f1a3c722'
+down_revision = '7a4d2c9e6b15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # With ix_blog_posts_last_edited, lets /api/posts?since= find new and edited posts by index
+    with op.batch_alter_table('blog_posts', schema=None) as batch_op:
+        batch_op.create_index('ix_blog_posts_date', ['date'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('blog_posts', schema=None) as batch_op:
+        batch_op.drop_index('ix_blog_posts_date')
@@ -0,0 +1,41 @@
+"""Add denormalized comment count and author name to blog posts
+
+Revision ID: c4a81f2e7b63
+Revises: 5e0b7c3a9d21
+Create Date: 2026-10-18 14:05:31.218406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a81f2e7b63'
+down_revision = '5e0b7c3a9d21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('blog_posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('comment_count', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('author_name', sa.String(length=101), nullable=True))
+
+    # Backfill existing posts
+    posts = sa.table('blog_posts', sa.column('id', sa.Integer), sa.column('author_id', sa.Integer),
+                     sa.column('comment_count', sa.Integer), sa.column('author_name', sa.String))
+    comments = sa.table('comments', sa.column('id', sa.Integer), sa.column('post_id', sa.Integer))
+    users = sa.table('users', sa.column('id', sa.Integer), sa.column('first_name', sa.String),
+                     sa.column('last_name', sa.String))
+    comment_count = sa.select(sa.func.count(comments.c.id)).where(comments.c.post_id == posts.c.id) \
+        .scalar_subquery()
+    author_name = sa.select(sa.func.trim(sa.func.coalesce(users.c.first_name, '') + ' ' +
+                                         sa.func.coalesce(users.c.last_name, ''))) \
+        .where(users.c.id == posts.c.author_id).scalar_subquery()
+    op.get_bind().execute(posts.update().values(comment_count=comment_count, author_name=author_name))
+
+
+def downgrade():
+    with op.batch_alter_table('blog_posts', schema=None) as batch_op:
+        batch_op.drop_column('author_name')
+        batch_op.drop_column('comment_count')
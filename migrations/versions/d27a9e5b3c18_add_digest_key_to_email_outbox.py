@@ -0,0 +1,28 @@
+"""Add digest key to email outbox
+
+Revision ID: d27a9e5b3c18
+Revises: 8b61d4f0c2e9
+Create Date: 2026-10-18 11:58:40.207716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd27a9e5b3c18'
+down_revision = '8b61d4f0c2e9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('email_outbox', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('digest_key', sa.String(length=191), nullable=True))
+        batch_op.create_index('ix_email_outbox_digest_key_status', ['digest_key', 'status'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('email_outbox', schema=None) as batch_op:
+        batch_op.drop_index('ix_email_outbox_digest_key_status')
+        batch_op.drop_column('digest_key')
@@ -0,0 +1,32 @@
+"""Add content versions
+
+Revision ID: d3c6a8b2f914
+Revises: b5e8f1a3c722
+Create Date: 2026-10-18 19:12:03.581940
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3c6a8b2f914'
+down_revision = 'b5e8f1a3c722'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Lets the listing watermark notice deletions without COUNT(*) over blog_posts
+    content_versions = op.create_table('content_versions',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(content_versions, [{'name': 'posts', 'version': 0, 'updated_at': datetime.utcnow()}])
+
+
+def downgrade():
+    op.drop_table('content_versions')
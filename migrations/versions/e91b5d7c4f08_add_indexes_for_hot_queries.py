@@ -0,0 +1,33 @@
+"""Add indexes for hot queries
+
+Revision ID: e91b5d7c4f08
+Revises: c4a81f2e7b63
+Create Date: 2026-10-18 14:48:12.530917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e91b5d7c4f08'
+down_revision = 'c4a81f2e7b63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Covers WHERE post_id = ? ORDER BY date_posted; also serves the post_id foreign key
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.create_index('ix_comments_post_id_date_posted', ['post_id', 'date_posted'], unique=False)
+
+    with op.batch_alter_table('blog_posts', schema=None) as batch_op:
+        batch_op.create_index('ix_blog_posts_last_edited', ['last_edited'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('blog_posts', schema=None) as batch_op:
+        batch_op.drop_index('ix_blog_posts_last_edited')
+
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.drop_index('ix_comments_post_id_date_posted')
@@ -0,0 +1,135 @@
+from flask import Flask
+from datetime import datetime, timedelta
+from database import db, EmailOutbox, DATABASE_URL, engine_options, init_engine_events
+from email_utils import build_digest_message, send_mail_batch
+from instrumentation import init_query_events
+import logging
+import os
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+# Outbox configuration
+BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 20))
+MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 8))
+BASE_BACKOFF = int(os.environ.get('OUTBOX_BASE_BACKOFF', 30))  # Seconds, doubled after every failure
+MAX_BACKOFF = int(os.environ.get('OUTBOX_MAX_BACKOFF', 3600))
+LEASE_SECONDS = int(os.environ.get('OUTBOX_LEASE_SECONDS', 300))  # Claimed rows are retried after this if a worker dies
+POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', 5))
+# Messages sharing a digest key within this many seconds are sent as one email (0 disables digests)
+DIGEST_WINDOW = int(os.environ.get('OUTBOX_DIGEST_WINDOW', 0))
+
+
+def enqueue_email(name, email, message, digest_key=None):
+    # Only queues the message; it is written by the caller's commit and sent by the outbox worker.
+    # With a digest window the message waits so later ones with the same key can join it.
+    row = EmailOutbox(name=name, email=email, message=message)
+    if DIGEST_WINDOW and digest_key:
+        row.digest_key = digest_key
+        row.next_attempt_at = datetime.utcnow() + timedelta(seconds=DIGEST_WINDOW)
+    db.session.add(row)
+
+
+def backoff_delay(attempts):
+    delay = min(MAX_BACKOFF, BASE_BACKOFF * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim_batch(batch_size=BATCH_SIZE):
+    now = datetime.utcnow()
+    # Rows left in 'sending' past their lease belong to a worker that died mid-batch
+    rows = EmailOutbox.query.filter(
+        EmailOutbox.status.in_(('pending', 'sending')),
+        EmailOutbox.next_attempt_at <= now
+    ).order_by(EmailOutbox.next_attempt_at).limit(batch_size).with_for_update(skip_locked=True).all()
+    # Pull in everything queued under the same digest keys, even if its own window hasn't closed
+    digest_keys = {row.digest_key for row in rows if row.digest_key}
+    if digest_keys:
+        claimed_ids = [row.id for row in rows]
+        rows += EmailOutbox.query.filter(
+            EmailOutbox.status == 'pending',
+            EmailOutbox.digest_key.in_(digest_keys),
+            EmailOutbox.id.notin_(claimed_ids)
+        ).with_for_update(skip_locked=True).all()
+    for row in rows:
+        row.status = 'sending'
+        row.next_attempt_at = now + timedelta(seconds=LEASE_SECONDS)
+    db.session.commit()
+    return rows
+
+
+def record_result(row, sent, error=None):
+    now = datetime.utcnow()
+    row.attempts += 1
+    if sent:
+        row.status = 'sent'
+        row.sent_at = now
+        row.last_error = None
+    elif row.attempts >= MAX_ATTEMPTS:
+        row.status = 'dead'
+        row.last_error = error
+        logger.error(f"Outbox message {row.id} moved to dead letter after {row.attempts} attempts: {error}")
+    else:
+        row.status = 'pending'
+        row.last_error = error
+        row.next_attempt_at = now + timedelta(seconds=backoff_delay(row.attempts))
+
+
+def group_rows(rows):
+    groups = {}
+    for row in sorted(rows, key=lambda row: row.id):
+        groups.setdefault(row.digest_key or f"row:{row.id}", []).append(row)
+    return list(groups.values())
+
+
+def drain_outbox(batch_size=BATCH_SIZE):
+    rows = claim_batch(batch_size)
+    if not rows:
+        return 0
+    # One email per digest group, and all of them in as few Graph calls as possible
+    groups = group_rows(rows)
+    messages = [build_digest_message([(row.name, row.email, row.message) for row in group]) for group in groups]
+    try:
+        results = send_mail_batch(messages)
+        errors = [None if sent else 'Graph sendMail failed' for sent in results]
+    except Exception as e:
+        logger.exception("Unexpected error sending outbox batch")
+        results = [False] * len(groups)
+        errors = [str(e)] * len(groups)
+    for group, sent, error in zip(groups, results, errors):
+        for row in group:
+            record_result(row, sent, error)
+    db.session.commit()
+    return len(rows)
+
+
+def run_worker():
+    logger.info("Outbox worker started.")
+    while True:
+        try:
+            processed = drain_outbox()
+        except Exception:
+            logger.exception("Outbox worker iteration failed")
+            db.session.rollback()
+            processed = 0
+        if processed < BATCH_SIZE:
+            time.sleep(POLL_INTERVAL)
+
+
+def create_worker_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options()
+    db.init_app(app)
+    with app.app_context():
+        init_engine_events(db.engine)
+        init_query_events(db.engine, track_requests=False)
+    return app
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    with create_worker_app().app_context():
+        run_worker()
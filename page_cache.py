@@ -0,0 +1,153 @@
+from collections import namedtuple
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 3
+
+# body is the uncompressed page; encodings maps 'gzip'/'br' to the precompressed body.
+# etag/last_modified (a timestamp) are optional validators answered without rebuilding the page.
+CachedPage = namedtuple('CachedPage', ['body', 'encodings', 'etag', 'last_modified'], defaults=(None, None))
+
+
+class PageCache:
+    """Rendered-page cache stored in a SQLite file shared by every gunicorn worker.
+
+    Entries carry tags (e.g. ``posts`` or ``post:3``) so a write can evict every
+    page that was built from the changed rows. The cache is bounded by
+    ``max_entries`` (least recently used entries are evicted first) and each
+    entry expires ``ttl`` seconds after it was stored, unless ``set`` is given its own.
+    """
+
+    def __init__(self, path, max_entries=500, ttl=300):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+
+    def _connect(self):
+        # SQLite connections must not cross a fork or be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            # Cache contents are disposable; start over when the layout changes
+            conn.execute("DROP TABLE IF EXISTS entries")
+            conn.execute("DROP TABLE IF EXISTS entry_tags")
+            conn.execute("DROP TABLE IF EXISTS tag_invalidations")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                gzip_body BLOB,
+                br_body BLOB,
+                etag TEXT,
+                last_modified REAL,
+                created REAL NOT NULL,
+                expires REAL NOT NULL,
+                accessed REAL NOT NULL
+            )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_entries_accessed ON entries (accessed)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entry_tags (
+                tag TEXT NOT NULL,
+                key TEXT NOT NULL,
+                PRIMARY KEY (tag, key)
+            )""")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS tag_invalidations (
+                tag TEXT PRIMARY KEY,
+                invalidated REAL NOT NULL
+            )""")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        try:
+            conn = self._connect()
+            row = conn.execute("SELECT body, gzip_body, br_body, etag, last_modified, expires, accessed "
+                               "FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            body, gzip_body, br_body, etag, last_modified, expires, accessed = row
+            now = time.time()
+            if now > expires:
+                self._delete_keys(conn, [key])
+                return None
+            # Only touch the LRU timestamp occasionally so hot pages don't turn every hit into a write
+            if now - accessed > 5:
+                conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            encodings = {encoding: data for encoding, data in (('gzip', gzip_body), ('br', br_body)) if data}
+            return CachedPage(body, encodings, etag, last_modified)
+        except sqlite3.Error as e:
+            logger.warning(f"Page cache read failed: {e}")
+            return None
+
+    def set(self, key, page, tags=(), started=None, ttl=None):
+        # `started` is when the page began rendering; if one of its tags was invalidated since then
+        # the body may already be stale, so it is not stored.
+        try:
+            conn = self._connect()
+            now = time.time()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                if started is not None and tags and conn.execute(
+                        f"SELECT 1 FROM tag_invalidations WHERE invalidated >= ? "
+                        f"AND tag IN ({','.join('?' * len(tags))})", (started, *tags)).fetchone():
+                    return
+                conn.execute("INSERT OR REPLACE INTO entries (key, body, gzip_body, br_body, etag, last_modified, "
+                             "created, expires, accessed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             (key, page.body, page.encodings.get('gzip'), page.encodings.get('br'), page.etag,
+                              page.last_modified, now, now + (ttl or self.ttl), now))
+                conn.execute("DELETE FROM entry_tags WHERE key = ?", (key,))
+                conn.executemany("INSERT OR IGNORE INTO entry_tags (tag, key) VALUES (?, ?)",
+                                 [(tag, key) for tag in tags])
+                self._evict(conn, now)
+        except sqlite3.Error as e:
+            logger.warning(f"Page cache write failed: {e}")
+
+    def invalidate(self, *tags):
+        if not tags:
+            return
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                keys = [row[0] for row in conn.execute(
+                    f"SELECT key FROM entry_tags WHERE tag IN ({','.join('?' * len(tags))})", tags)]
+                self._delete_keys(conn, keys)
+                conn.executemany("INSERT OR REPLACE INTO tag_invalidations (tag, invalidated) VALUES (?, ?)",
+                                 [(tag, time.time()) for tag in tags])
+        except sqlite3.Error as e:
+            logger.error(f"Page cache invalidation failed: {e}")
+
+    def clear(self):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM entries")
+            conn.execute("DELETE FROM entry_tags")
+            conn.execute("DELETE FROM tag_invalidations")
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM entries WHERE expires < ?", (now,))
+        conn.execute("""
+            DELETE FROM entries WHERE key IN (
+                SELECT key FROM entries ORDER BY accessed DESC LIMIT -1 OFFSET ?
+            )""", (self.max_entries,))
+        conn.execute("DELETE FROM entry_tags WHERE key NOT IN (SELECT key FROM entries)")
+        conn.execute("DELETE FROM tag_invalidations WHERE invalidated < ?", (now - self.ttl,))
+
+    @staticmethod
+    def _delete_keys(conn, keys):
+        for key in keys:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            conn.execute("DELETE FROM entry_tags WHERE key = ?", (key,))
@@ -0,0 +1,42 @@
+import base64
+import binascii
+
+
+# Opaque cursor tokens so clients can't rely on the key being a plain id
+def encode_cursor(value):
+    return base64.urlsafe_b64encode(str(value).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        return int(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode('utf-8'))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+class KeysetPage:
+    """One page of a newest-first keyset (seek) query.
+
+    ``after`` returns rows older than the cursor, ``before`` rows newer than it.
+    No COUNT and no OFFSET is issued, so the cost of a page doesn't depend on how
+    deep it is and rows inserted meanwhile don't shift the page boundaries.
+    """
+
+    def __init__(self, query, column, per_page, key=None, after=None, before=None):
+        key = key or (lambda row: getattr(row, column.key))
+        if before is not None:
+            rows = query.filter(column > before).order_by(column.asc()).limit(per_page + 1).all()
+            self.has_prev = len(rows) > per_page
+            self.items = list(reversed(rows[:per_page]))
+            self.has_next = True
+        else:
+            if after is not None:
+                query = query.filter(column < after)
+            rows = query.order_by(column.desc()).limit(per_page + 1).all()
+            self.has_next = len(rows) > per_page
+            self.items = rows[:per_page]
+            self.has_prev = after is not None
+        self.next_cursor = encode_cursor(key(self.items[-1])) if self.has_next and self.items else None
+        self.prev_cursor = encode_cursor(key(self.items[0])) if self.has_prev and self.items else None
@@ -0,0 +1,146 @@
+from datetime import datetime, timezone
+from sqlalchemy import select, func
+from sqlalchemy.orm import joinedload, defer
+from database import db, User, BlogPost, Comment, ContentVersion
+
+
+# Query helpers for the read views. Posts carry their author's name and comment count
+# (see BlogPost.author_name/comment_count), so listings read blog_posts alone; comment
+# authors are joined in up front (only the columns the templates print).
+# Listings never load BlogPost.body; use excerpt/reading_time for teasers instead.
+
+def latest_posts(limit=10):
+    return listing_query().order_by(BlogPost.id.desc()).limit(limit).all()
+
+
+def listing_query():
+    return BlogPost.query.options(defer(BlogPost.body, raiseload=True))
+
+
+def comments_query(post_id):
+    return Comment.query.options(
+        joinedload(Comment.author).load_only(User.email, User.first_name, User.last_name)
+    ).filter(Comment.post_id == post_id).order_by(Comment.date_posted)
+
+
+def comments_with_authors(post_id):
+    return comments_query(post_id).all()
+
+
+# Watermarks for conditional GET: one indexed query that changes whenever the page would.
+# Each returns (version, last_modified), or None when there is nothing to show.
+
+def post_watermark_query(post_id):
+    # The 'posts' content version covers what the post row can't show: renamed authors and
+    # commenters (the page prints both names) and deleted comments
+    newest_comment = select(func.max(Comment.date_posted)).where(Comment.post_id == post_id).scalar_subquery()
+    content_version = select(ContentVersion.version).where(ContentVersion.name == 'posts').scalar_subquery()
+    content_updated = select(ContentVersion.updated_at).where(ContentVersion.name == 'posts').scalar_subquery()
+    return select(BlogPost.date, BlogPost.last_edited, BlogPost.comment_count, newest_comment, content_version,
+                  content_updated).where(BlogPost.id == post_id)
+
+
+def post_watermark(post_id):
+    row = db.session.execute(post_watermark_query(post_id)).first()
+    if row is None:
+        return None
+    date, last_edited, comment_count, newest_comment_date, content_version, content_updated = row
+    return (last_edited or date, comment_count, newest_comment_date, content_version), \
+        max(filter(None, (date, last_edited, newest_comment_date, content_updated)))
+
+
+def listing_watermark_query():
+    # MAX(id) catches additions, MAX(last_edited) edits, the newest comment id new comments
+    # (listings show comment counts) and the 'posts' content version deletions and other
+    # changes those can't see. Every part is a primary key or index lookup, with no COUNT.
+    newest_post_id = select(func.max(BlogPost.id)).scalar_subquery()
+    newest_post_date = select(BlogPost.date).where(BlogPost.id == newest_post_id).scalar_subquery()
+    newest_comment_id = select(func.max(Comment.id)).scalar_subquery()
+    newest_comment_date = select(Comment.date_posted).where(Comment.id == newest_comment_id).scalar_subquery()
+    content_version = select(ContentVersion.version).where(ContentVersion.name == 'posts').scalar_subquery()
+    content_updated = select(ContentVersion.updated_at).where(ContentVersion.name == 'posts').scalar_subquery()
+    return select(newest_post_id, select(func.max(BlogPost.last_edited)).scalar_subquery(), newest_post_date,
+                  newest_comment_id, newest_comment_date, content_version, content_updated)
+
+
+def listing_watermark():
+    newest_post_id, last_edited, newest_post_date, newest_comment_id, newest_comment_date, content_version, \
+        content_updated = db.session.execute(listing_watermark_query()).first()
+    if newest_post_id is None:
+        return None
+    return (newest_post_id, last_edited, newest_comment_id, content_version), \
+        max(filter(None, (newest_post_date, last_edited, newest_comment_date, content_updated)))
+
+
+# JSON API: the fields a client may ask for with ?fields=, each a labelled column, so
+# responses are built from plain rows and never from ORM entities.
+
+POST_FIELDS = {
+    'id': BlogPost.id,
+    'title': BlogPost.title,
+    'subtitle': BlogPost.subtitle,
+    'date': BlogPost.date,
+    'last_edited': BlogPost.last_edited,
+    'author_id': BlogPost.author_id,
+    'author_name': BlogPost.author_name,
+    'img_url': BlogPost.img_url,
+    'excerpt': BlogPost.excerpt,
+    'reading_time': BlogPost.reading_time,
+    'comment_count': BlogPost.comment_count,
+    'body': BlogPost.body,
+}
+POST_LIST_FIELDS = [name for name in POST_FIELDS if name != 'body']
+
+COMMENT_FIELDS = {
+    'id': Comment.id,
+    'post_id': Comment.post_id,
+    'text': Comment.text,
+    'date_posted': Comment.date_posted,
+    'author_id': Comment.author_id,
+    'author_name': func.trim(func.coalesce(User.first_name, '') + ' ' + func.coalesce(User.last_name, '')),
+}
+
+
+def parse_fields(value, available, default):
+    # "title,date" -> ['id', 'title', 'date']; the id is always included since cursors use it
+    if not value:
+        return list(default)
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return ['id'] + [name for name in dict.fromkeys(names) if name != 'id']
+
+
+def parse_since(value):
+    # ISO 8601; stored datetimes are naive, so aware values are converted to UTC first
+    if not value:
+        return None
+    try:
+        since = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError("since must be an ISO 8601 date/time, e.g. 2024-05-30T14:06:19Z") from None
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    return since
+
+
+def api_posts_query(fields, since=None):
+    query = db.session.query(*(POST_FIELDS[name].label(name) for name in fields))
+    if since is not None:
+        # New posts have no last_edited yet, so their creation date counts as a change too
+        query = query.filter((BlogPost.last_edited > since) | (BlogPost.date > since))
+    return query
+
+
+def api_comments_query(post_id, fields):
+    query = db.session.query(*(COMMENT_FIELDS[name].label(name) for name in fields)) \
+        .filter(Comment.post_id == post_id)
+    if 'author_name' in fields:
+        query = query.outerjoin(User, User.id == Comment.author_id)
+    return query
+
+
+def row_to_dict(row):
+    return {name: value.isoformat() if isinstance(value, datetime) else value
+            for name, value in row._mapping.items()}
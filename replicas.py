@@ -0,0 +1,160 @@
+from flask import session as flask_session, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Select, event
+from sqlalchemy.exc import DBAPIError
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Comma-separated read replica URLs; without any, everything stays on the primary
+REPLICA_URLS = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+REPLICA_MAX_LAG = int(os.environ.get('REPLICA_MAX_LAG', 5))  # Seconds behind the primary before a replica is skipped
+REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', 5))  # Seconds between health checks
+# After a write, the writer's reads stay on the primary this long so they see their own changes
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 15))
+STICKY_SESSION_KEY = '_primary_until'
+REPLICA_BIND_PREFIX = 'replica'
+
+
+def replica_binds():
+    # For SQLALCHEMY_BINDS; no model uses these keys, only RoutingSession does
+    return {f"{REPLICA_BIND_PREFIX}{i}": url for i, url in enumerate(REPLICA_URLS)}
+
+
+def replica_lag(connection):
+    # Seconds behind the primary, or None when replication isn't running
+    if connection.dialect.name != 'mysql':
+        return 0
+    for statement, column in (('SHOW REPLICA STATUS', 'Seconds_Behind_Source'),
+                              ('SHOW SLAVE STATUS', 'Seconds_Behind_Master')):  # Before MySQL 8.0.22
+        try:
+            row = connection.exec_driver_sql(statement).mappings().first()
+        except DBAPIError:
+            continue
+        return row[column] if row is not None else None
+    return None
+
+
+class ReplicaHealth:
+    """Per-process view of which replicas are usable.
+
+    Checks run in a background thread at most every REPLICA_CHECK_INTERVAL, so a replica that
+    is slow to connect never holds up a request; until its first check passes it is not used.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {}  # bind key -> {'checked': ..., 'healthy': ..., 'lag': ..., 'error': ...}
+        self._checking = set()
+
+    def healthy(self, key, engine):
+        state = self._state.get(key)
+        if state is None or time.monotonic() - state['checked'] >= REPLICA_CHECK_INTERVAL:
+            self._schedule_check(key, engine)
+        return state is not None and state['healthy']
+
+    def _schedule_check(self, key, engine):
+        with self._lock:
+            if key in self._checking:
+                return
+            self._checking.add(key)
+        threading.Thread(target=self._check, args=(key, engine), name=f"replica-check-{key}", daemon=True).start()
+
+    def _check(self, key, engine):
+        lag, error = None, None
+        try:
+            with engine.connect() as connection:
+                lag = replica_lag(connection)
+        except DBAPIError as e:
+            error = str(e.orig)
+        finally:
+            with self._lock:
+                self._checking.discard(key)
+        healthy = error is None and lag is not None and lag <= REPLICA_MAX_LAG
+        state = self._state.get(key)
+        if not healthy and (state is None or state['healthy']):
+            logger.warning(f"Replica {key} taken out of rotation (lag {lag}, error {error})")
+        with self._lock:
+            self._state[key] = {'checked': time.monotonic(), 'healthy': healthy, 'lag': lag, 'error': error}
+
+    def mark_down(self, key, error):
+        with self._lock:
+            self._state[key] = {'checked': time.monotonic(), 'healthy': False, 'lag': None, 'error': error}
+
+    def snapshot(self):
+        with self._lock:
+            return {key: {name: value for name, value in state.items() if name != 'checked'}
+                    for key, state in self._state.items()}
+
+
+replica_health = ReplicaHealth()
+
+
+def choose_replica(engines):
+    # One healthy replica for the whole request, so its reads see a single point in time
+    keys = [key for key in engines if key and key.startswith(REPLICA_BIND_PREFIX)]
+    random.shuffle(keys)
+    for key in keys:
+        if replica_health.healthy(key, engines[key]):
+            return engines[key]
+    return None
+
+
+def recently_wrote():
+    return flask_session.get(STICKY_SESSION_KEY, 0) > time.time()
+
+
+def init_replica_events(engines):
+    for key, engine in engines.items():
+        if not key or not key.startswith(REPLICA_BIND_PREFIX):
+            continue
+
+        @event.listens_for(engine, 'handle_error')
+        def take_out_of_rotation(exception_context, key=key):
+            # A dropped connection fails the current request; later ones go elsewhere until the next check
+            if exception_context.is_disconnect:
+                replica_health.mark_down(key, str(exception_context.original_exception))
+
+
+class RoutingSession(Session):
+    """Sends plain SELECTs to the replica chosen for the request (session.info['replica']).
+
+    Writes, flushes, SELECT ... FOR UPDATE and anything after the session's first flush
+    use the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = self.info.get('replica')
+        if (replica is not None and bind is None and not self._flushing
+                and isinstance(clause, Select) and clause._for_update_arg is None):
+            return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def read_own_writes(session, flush_context):
+    session.info['replica'] = None
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def read_own_bulk_writes(orm_execute_state):
+    # Bulk INSERT/UPDATE/DELETE through session.execute() never flush, so mark the write here too
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['replica'] = None
+        orm_execute_state.session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def stick_to_primary(session):
+    if session.info.pop('wrote', False) and REPLICA_URLS and has_request_context():
+        flask_session[STICKY_SESSION_KEY] = time.time() + REPLICA_STICKY_SECONDS
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def forget_writes(session):
+    session.info.pop('wrote', None)
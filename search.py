@@ -0,0 +1,166 @@
+from collections import Counter, defaultdict
+from sqlalchemy import func, select, text
+from database import db, BlogPost, ContentVersion
+import math
+import os
+import re
+import threading
+import unicodedata
+
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'memory')  # 'memory' or 'mysql'
+TITLE_WEIGHT = 3  # Title and subtitle tokens count this many times towards the term frequency
+
+# Hiragana, katakana, CJK ideographs and half-width katakana are tokenized as character bigrams,
+# everything else as alphanumeric words. Documents also index each character on its own, so a
+# one-character query (東) still finds 東京; longer queries only look up bigrams.
+CJK_RUN = re.compile(r'[぀-ヿ㐀-䶿一-鿿豈-﫿ｦ-ﾟー]+')
+WORD = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(value, unigrams=False):
+    value = unicodedata.normalize('NFKC', value or '').lower()
+    tokens = []
+    for run in CJK_RUN.findall(value):
+        if len(run) == 1 or unigrams:
+            tokens.extend(run)
+        if len(run) > 1:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    tokens.extend(WORD.findall(CJK_RUN.sub(' ', value)))
+    return tokens
+
+
+class MemorySearchIndex:
+    """In-process inverted index over post title, subtitle and body text, ranked with BM25.
+
+    Each worker holds its own index. Writes in this worker update it directly; changes made
+    by other workers are picked up by comparing a watermark (newest id, newest edit and the
+    'posts' content version, which deletions bump) with one indexed query before each search.
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.postings = defaultdict(dict)  # token -> {post_id: term frequency}
+        self.doc_lengths = {}
+        self.doc_terms = {}  # post_id -> tokens, so a post can be removed without scanning the vocabulary
+        self.total_length = 0
+        self.watermark = None
+
+    def index_post(self, post):
+        self.add(post.id, post.title, post.subtitle, post.search_text)
+
+    def add(self, post_id, title, subtitle, body_text):
+        counts = Counter(tokenize(body_text, unigrams=True))
+        for token in tokenize(f"{title} {subtitle}", unigrams=True):
+            counts[token] += TITLE_WEIGHT
+        with self._lock:
+            self._remove(post_id)
+            for token, tf in counts.items():
+                self.postings[token][post_id] = tf
+            length = sum(counts.values())
+            self.doc_lengths[post_id] = length
+            self.doc_terms[post_id] = list(counts)
+            self.total_length += length
+
+    def remove_post(self, post_id):
+        with self._lock:
+            self._remove(post_id)
+
+    def _remove(self, post_id):
+        if post_id not in self.doc_lengths:
+            return
+        for token in self.doc_terms.pop(post_id):
+            postings = self.postings[token]
+            postings.pop(post_id, None)
+            if not postings:
+                del self.postings[token]
+        self.total_length -= self.doc_lengths.pop(post_id)
+
+    def search(self, query, limit=20):
+        self.sync()
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            postings = [self.postings.get(term, {}) for term in terms]
+            if not all(postings):
+                return []
+            # Every query term has to match; bigrams alone are too noisy for OR semantics
+            candidates = set.intersection(*(set(p) for p in postings))
+            doc_count = len(self.doc_lengths)
+            avg_length = self.total_length / doc_count if doc_count else 0
+            scores = {}
+            for term_postings in postings:
+                idf = math.log(1 + (doc_count - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+                for post_id in candidates:
+                    tf = term_postings[post_id]
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[post_id] / avg_length)
+                    scores[post_id] = scores.get(post_id, 0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return [post_id for post_id, score in sorted(scores.items(), key=lambda item: (-item[1], -item[0]))[:limit]]
+
+    @staticmethod
+    def watermark_query():
+        # Separate subqueries, so each MAX() is a single index lookup
+        return select(select(ContentVersion.version).where(ContentVersion.name == 'posts').scalar_subquery(),
+                      select(func.max(BlogPost.id)).scalar_subquery(),
+                      select(func.max(BlogPost.last_edited)).scalar_subquery())
+
+    def sync(self):
+        watermark = tuple(db.session.execute(self.watermark_query()).one())
+        if watermark == self.watermark:
+            return
+        previous = self.watermark
+        if previous is not None and previous[0] != watermark[0]:
+            # Posts were deleted (or renamed/repaired) elsewhere; rebuild from scratch
+            self.rebuild()
+            self.watermark = watermark
+            return
+        query = db.session.query(BlogPost.id, BlogPost.title, BlogPost.subtitle, BlogPost.search_text)
+        if previous is not None and previous[1] is not None:
+            # Only posts created or edited since the last sync
+            changed = BlogPost.id > previous[1]
+            if previous[2] is not None:
+                changed = changed | (BlogPost.last_edited > previous[2])
+            else:
+                changed = changed | BlogPost.last_edited.isnot(None)
+            query = query.filter(changed)
+        for post_id, title, subtitle, body_text in query.all():
+            self.add(post_id, title, subtitle, body_text)
+        self.watermark = watermark
+
+    def rebuild(self):
+        with self._lock:
+            self.postings.clear()
+            self.doc_lengths.clear()
+            self.doc_terms.clear()
+            self.total_length = 0
+        for post_id, title, subtitle, body_text in db.session.query(
+                BlogPost.id, BlogPost.title, BlogPost.subtitle, BlogPost.search_text).all():
+            self.add(post_id, title, subtitle, body_text)
+
+
+class MySQLFullTextSearch:
+    # Uses the ngram FULLTEXT index created by the search migration; MySQL keeps it up to date
+    def index_post(self, post):
+        pass
+
+    def remove_post(self, post_id):
+        pass
+
+    def search(self, query, limit=20):
+        if not query.strip():
+            return []
+        rows = db.session.execute(text(
+            "SELECT id FROM blog_posts "
+            "WHERE MATCH(title, subtitle, search_text) AGAINST (:query IN NATURAL LANGUAGE MODE) "
+            "ORDER BY MATCH(title, subtitle, search_text) AGAINST (:query IN NATURAL LANGUAGE MODE) DESC "
+            "LIMIT :limit"), {'query': query, 'limit': limit})
+        return [row[0] for row in rows]
+
+
+def create_search_backend(name=SEARCH_BACKEND):
+    if name == 'mysql':
+        return MySQLFullTextSearch()
+    return MemorySearchIndex()
@@ -0,0 +1,107 @@
+from flask import request, send_from_directory, url_for, abort
+from werkzeug.utils import safe_join
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+# Brotli is optional; without it only gzip variants are generated
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DIST_DIR = 'dist'  # Build output, under the static folder
+MANIFEST_NAME = 'manifest.json'
+FINGERPRINT_EXTENSIONS = {'.css', '.js', '.jpg', '.jpeg', '.png', '.gif', '.ico', '.svg', '.webp', '.woff2'}
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.ico'}
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+
+def build_assets(static_folder):
+    """Write content-hashed copies of static files to static/dist, with .gz/.br siblings.
+
+    Returns the manifest mapping original paths (as passed to url_for('static', ...))
+    to fingerprinted paths under dist/.
+    """
+    dist_folder = os.path.join(static_folder, DIST_DIR)
+    if os.path.isdir(dist_folder):
+        shutil.rmtree(dist_folder)
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist_folder]
+        for name in files:
+            stem, extension = os.path.splitext(name)
+            if extension.lower() not in FINGERPRINT_EXTENSIONS:
+                continue
+            source = os.path.join(root, name)
+            relative = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            hashed = '/'.join(filter(None, [os.path.dirname(relative), f"{stem}.{digest}{extension}"]))
+            target = os.path.join(dist_folder, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(data)
+            if extension.lower() in COMPRESSIBLE_EXTENSIONS:
+                with open(target + '.gz', 'wb') as f:
+                    f.write(gzip.compress(data, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    with open(target + '.br', 'wb') as f:
+                        f.write(brotli.compress(data, quality=11))
+            manifest[relative] = hashed
+    with open(os.path.join(dist_folder, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def init_static_assets(app):
+    # Without a built manifest, url_for('static', ...) behaves exactly as before
+    manifest = load_manifest(app.static_folder)
+    dist_folder = os.path.join(app.static_folder, DIST_DIR)
+
+    def asset_url_for(endpoint, **values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+            endpoint = 'hashed_static'
+        return url_for(endpoint, **values)
+
+    def hashed_static(filename):
+        path = safe_join(dist_folder, filename)
+        if path is None:
+            abort(404)
+        # Serve a precompressed variant when the client accepts it
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if request.accept_encodings.quality(encoding) and os.path.isfile(path + suffix):
+                response = send_from_directory(dist_folder, filename + suffix, max_age=ASSET_MAX_AGE,
+                                               mimetype=mimetypes.guess_type(filename)[0])
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            if not os.path.isfile(path):
+                abort(404)
+            response = send_from_directory(dist_folder, filename, max_age=ASSET_MAX_AGE)
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    app.add_url_rule('/assets/<path:filename>', 'hashed_static', hashed_static)
+    app.jinja_env.globals['url_for'] = asset_url_for
+
+    @app.cli.command('build-assets')
+    def build_assets_command():
+        """Fingerprint and precompress static assets into static/dist."""
+        built = build_assets(app.static_folder)
+        print(f"Built {len(built)} assets into {dist_folder}")
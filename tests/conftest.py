@@ -0,0 +1,26 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# main.py and database.py read their settings at import, so point them at a throwaway SQLite
+# database and cache files before any test imports them
+TEST_DIR = tempfile.mkdtemp(prefix='blog-tests-')
+os.environ.update({
+    'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(TEST_DIR, 'blog.sqlite3')}",
+    'DATABASE_REPLICA_URLS': '',
+    'PAGE_CACHE_PATH': os.path.join(TEST_DIR, 'page_cache.sqlite3'),
+    'TOKEN_CACHE_PATH': os.path.join(TEST_DIR, 'graph_token.json'),
+    'SEARCH_BACKEND': 'memory',
+    'LOG_LEVEL': 'WARNING',
+})
+os.environ.setdefault('FLASK_SECRET_KEY', 'test')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app():
+    from main import app
+    app.config.update(TESTING=True)
+    return app
@@ -0,0 +1,63 @@
+import pytest
+from sqlalchemy import insert, update
+
+from database import db, User, BlogPost, bump_content_version
+
+
+@pytest.fixture
+def client(app):
+    with app.app_context():
+        db.drop_all(bind_key=None)
+        db.create_all(bind_key=None)
+        db.session.execute(insert(User), [{'username': 'author', 'email': 'author@example.com', 'first_name': 'Old',
+                                           'last_name': 'Name', 'password': 'x'}])
+        db.session.add(BlogPost(title='Post', subtitle='subtitle', body='<p>body</p>', author_id=1))
+        db.session.commit()
+    return app.test_client()
+
+
+def test_renamed_author_is_not_served_from_the_cache(app, client):
+    assert b'Old Name' in client.get('/blog').data
+    with app.app_context():
+        db.session.get(User, 1).first_name = 'New'
+        db.session.commit()
+    assert b'New Name' in client.get('/blog').data
+
+
+def test_cached_page_older_than_the_watermark_is_rebuilt(app, client):
+    assert b'>Post<' in client.get('/blog').data
+    with app.app_context():
+        # A write whose page_cache.invalidate() hasn't run yet
+        db.session.execute(update(BlogPost).values(title='Edited'))
+        bump_content_version(db.session.connection())
+        db.session.commit()
+    response = client.get('/blog')
+    assert b'>Edited<' in response.data
+    assert client.get('/blog', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+
+def test_renamed_author_changes_the_post_etag(app, client):
+    etag = client.get('/blog/post/1').headers['ETag']
+    with app.app_context():
+        db.session.get(User, 1).last_name = 'Changed'
+        db.session.commit()
+    response = client.get('/blog/post/1', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert b'Old Changed' in response.data
+
+
+def test_pending_flash_keeps_conditional_get(app, client):
+    # None of the conditional pages show flashed messages, so one left in the session changes nothing
+    with client.session_transaction() as session:
+        session['_flashes'] = [('message', 'Comment posted successfully and email notification queued.')]
+    response = client.get('/blog/post/1')
+    assert client.get('/blog/post/1', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+
+@pytest.mark.parametrize('url', ['/', '/blog', '/blog/post/1', '/api/posts'])
+def test_not_modified_carries_the_same_caching_headers(client, url):
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    revalidated = client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert revalidated.vary == response.vary
+    assert revalidated.headers['Cache-Control'] == response.headers['Cache-Control']
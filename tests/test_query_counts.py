@@ -0,0 +1,79 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, insert
+
+from database import db, User, BlogPost, Comment, repair_post_counters
+
+USERS = 20
+POSTS = 12
+
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def seed():
+    db.drop_all(bind_key=None)
+    db.create_all(bind_key=None)
+    now = datetime.utcnow()
+    db.session.execute(insert(User), [
+        {'username': f"user{i}", 'email': f"user{i}@example.com", 'first_name': 'First', 'last_name': str(i),
+         'password': 'x'} for i in range(1, USERS + 1)])
+    db.session.execute(insert(BlogPost), [
+        {'title': f"Post {i}", 'subtitle': 'subtitle', 'body': '<p>body</p>', 'excerpt': 'body', 'reading_time': 1,
+         'author_id': 1 + i % USERS, 'date': now - timedelta(hours=POSTS - i)} for i in range(1, POSTS + 1)])
+    db.session.commit()
+    repair_post_counters()
+
+
+def add_comments(per_post):
+    # Spread over every post and many authors, so per-row lookups would show up as extra queries
+    now = datetime.utcnow()
+    db.session.execute(insert(Comment), [
+        {'text': 'comment', 'author_id': 1 + n % USERS, 'post_id': post_id, 'date_posted': now + timedelta(seconds=n)}
+        for post_id in range(1, POSTS + 1) for n in range(per_post)])
+    db.session.commit()
+    repair_post_counters()
+
+
+@pytest.fixture
+def client(app):
+    # Count what a render costs, not what the page cache saves
+    app.config['PAGE_CACHE_ENABLED'] = False
+    with app.app_context():
+        seed()
+    yield app.test_client()
+    app.config['PAGE_CACHE_ENABLED'] = True
+
+
+def statements_for(app, client, url):
+    with app.app_context(), count_statements() as statements:
+        response = client.get(url)
+    assert response.status_code == 200
+    return len(statements)
+
+
+# Watermark for conditional GET + the page's own query (+ the comments for a post)
+EXPECTED_STATEMENTS = {'/': 2, '/blog': 2, f'/blog/post/{POSTS}': 3}
+
+
+@pytest.mark.parametrize('url', EXPECTED_STATEMENTS)
+def test_statements_per_page_do_not_grow_with_comments(app, client, url):
+    counts = []
+    for per_post in (1, 10, 40):
+        with app.app_context():
+            add_comments(per_post)
+        counts.append(statements_for(app, client, url))
+    assert counts == [EXPECTED_STATEMENTS[url]] * 3
@@ -0,0 +1,41 @@
+import pytest
+from sqlalchemy import text
+
+from database import db
+from explain_hot_queries import seed, hot_queries, explain, full_scans, describe
+from queries import comments_query
+
+
+@pytest.fixture(scope='module')
+def seeded(app):
+    # Enough rows (and fresh ANALYZE statistics) that the planner prefers indexes where it can
+    with app.app_context():
+        seed(2000)
+        yield
+
+
+def test_hot_queries_avoid_full_scans(app, seeded):
+    with app.app_context(), db.engine.connect() as connection:
+        dialect = connection.dialect.name
+        failures = {}
+        for name, statement, rowid_order in hot_queries():
+            plan = explain(connection, statement)
+            if full_scans(dialect, plan, rowid_order):
+                failures[name] = describe(dialect, plan)
+    assert failures == {}
+
+
+def test_dropped_index_is_reported(app, seeded):
+    with app.app_context():
+        with db.engine.begin() as connection:
+            connection.execute(text('DROP INDEX ix_comments_post_id_date_posted'))
+        # Pooled connections keep prepared EXPLAINs, which SQLite doesn't re-plan after a schema change
+        db.engine.dispose()
+        try:
+            with db.engine.connect() as connection:
+                plan = explain(connection, comments_query(100).statement)
+                assert full_scans(connection.dialect.name, plan, False)
+        finally:
+            with db.engine.begin() as connection:
+                connection.execute(text('CREATE INDEX ix_comments_post_id_date_posted ON comments (post_id, date_posted)'))
+            db.engine.dispose()
@@ -0,0 +1,47 @@
+import time
+
+import pytest
+from sqlalchemy import insert
+
+import replicas
+from database import db, User, BlogPost
+
+
+@pytest.fixture
+def admin_client(app, monkeypatch):
+    # Read-your-writes only kicks in when replicas are configured
+    monkeypatch.setattr(replicas, 'REPLICA_URLS', ['sqlite://'])
+    monkeypatch.setitem(app.config, 'WTF_CSRF_ENABLED', False)
+    with app.app_context():
+        db.drop_all(bind_key=None)
+        db.create_all(bind_key=None)
+        db.session.execute(insert(User), [{'username': 'admin', 'email': 'admin@example.com', 'first_name': 'Admin',
+                                           'last_name': 'User', 'password': 'x'}])
+        db.session.execute(insert(BlogPost), [
+            {'title': f"Post {i}", 'subtitle': 'subtitle', 'body': '<p>body</p>', 'author_id': 1}
+            for i in range(1, 4)])
+        db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+        session['_fresh'] = True
+    return client
+
+
+def primary_until(client):
+    with client.session_transaction() as session:
+        return session.get(replicas.STICKY_SESSION_KEY, 0)
+
+
+def test_delete_sticks_to_primary(app, admin_client):
+    response = admin_client.get('/blog/delete/1')
+    assert response.status_code == 302
+    assert primary_until(admin_client) > time.time()
+
+
+def test_bulk_delete_sticks_to_primary(app, admin_client):
+    response = admin_client.post('/admin/posts/delete', data={'post_ids': ['2', '3']})
+    assert response.status_code == 302
+    assert primary_until(admin_client) > time.time()
+    with app.app_context():
+        assert db.session.query(BlogPost).count() == 1
@@ -0,0 +1,48 @@
+from html.parser import HTMLParser
+import re
+
+# Reading speeds used for the reading-time estimate
+JAPANESE_CHARS_PER_MINUTE = 500
+WORDS_PER_MINUTE = 200
+
+CJK_PATTERN = re.compile(r'[぀-ヿ㐀-䶿一-鿿豈-﫿ｦ-ﾟ]')
+WORD_PATTERN = re.compile(r'[A-Za-z0-9]+')
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('script', 'style'):
+            self._skip += 1
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style') and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def html_to_text(html):
+    parser = _TextExtractor()
+    parser.feed(html or '')
+    parser.close()
+    return ' '.join(' '.join(parser.parts).split())
+
+
+def make_excerpt(text, length=200):
+    if len(text) <= length:
+        return text
+    return text[:length - 1].rstrip() + '…'
+
+
+def reading_time_minutes(text):
+    cjk_chars = len(CJK_PATTERN.findall(text))
+    words = len(WORD_PATTERN.findall(text))
+    minutes = cjk_chars / JAPANESE_CHARS_PER_MINUTE + words / WORDS_PER_MINUTE
+    return max(1, round(minutes))
@@ -0,0 +1,132 @@
+from concurrent.futures import ProcessPoolExecutor
+from werkzeug.utils import secure_filename
+import hashlib
+import logging
+import os
+import re
+import tempfile
+
+# Pillow is optional; without it originals are stored but no derivatives are made
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+VARIANT_WIDTHS = (480, 960, 1600)
+VARIANT_QUALITY = 80
+# Stored originals are named <sha256>.<ext>, derivatives <sha256>.w<width>.webp and <sha256>.webp
+HASHED_NAME = re.compile(r'^[0-9a-f]{64}(\.w\d+)?\.[a-z0-9]+$')
+VARIANT_SOURCES = {'.jpg', '.jpeg', '.png'}  # Originals that get WebP derivatives
+# Uploaded images in post bodies, as CKEditor inserts them
+UPLOADED_IMG = re.compile(r'<img\b[^>]*\bsrc="(?P<base>[^"]*/uploads/)(?P<name>[0-9a-f]{64}\.(?:jpe?g|png))"[^>]*>')
+IMAGE_SIZES = '(max-width: 960px) 100vw, 960px'
+
+_executor = None
+_executor_pid = None
+
+
+def store_upload(file_storage, upload_folder):
+    """Copy an uploaded file to disk in chunks while hashing it, and store it under its hash.
+
+    Returns ``(filename, created)``; ``created`` is False when identical content was
+    already stored, in which case the new copy is discarded.
+    """
+    extension = os.path.splitext(secure_filename(file_storage.filename or ''))[1].lower()
+    fd, tmp_path = tempfile.mkstemp(dir=upload_folder, prefix='.upload-')
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = file_storage.stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+        filename = digest.hexdigest() + extension
+        final_path = os.path.join(upload_folder, filename)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)
+            return filename, False
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, final_path)
+        return filename, True
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def variant_filename(filename, width=None):
+    stem = filename.split('.', 1)[0]
+    return f"{stem}.w{width}.webp" if width else f"{stem}.webp"
+
+
+def webp_alternative(filename, upload_folder):
+    # The full-size WebP copy of a stored original, once it has been generated
+    if os.path.splitext(filename)[1] not in VARIANT_SOURCES or not HASHED_NAME.match(filename):
+        return None
+    webp = variant_filename(filename)
+    return webp if os.path.isfile(os.path.join(upload_folder, webp)) else None
+
+
+def variant_srcset(filename, upload_folder, base_url):
+    # "<url> 480w, <url> 960w, ..." over the WebP variants generated so far; '' if there are none yet
+    candidates = [(variant_filename(filename, width), width) for width in VARIANT_WIDTHS
+                  if os.path.isfile(os.path.join(upload_folder, variant_filename(filename, width)))]
+    full = webp_alternative(filename, upload_folder)
+    if full and Image is not None:
+        with Image.open(os.path.join(upload_folder, full)) as img:  # Reads the header only
+            candidates.append((full, img.width))
+    return ', '.join(f"{base_url}{name} {width}w" for name, width in candidates)
+
+
+def responsive_images(html, upload_folder):
+    """Wrap uploaded JPEG/PNG images in a <picture> offering their resized WebP variants."""
+    def picture(match):
+        srcset = variant_srcset(match['name'], upload_folder, match['base'])
+        if not srcset:
+            return match[0]
+        return f'<picture><source type="image/webp" srcset="{srcset}" sizes="{IMAGE_SIZES}">{match[0]}</picture>'
+
+    return UPLOADED_IMG.sub(picture, html or '')
+
+
+def generate_variants(path):
+    # Runs in a worker process: resized WebP copies for each width narrower than the original
+    folder, filename = os.path.split(path)
+    with Image.open(path) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+        targets = [(None, img)]
+        for width in VARIANT_WIDTHS:
+            if img.width > width:
+                targets.append((width, img.resize((width, round(img.height * width / img.width)),
+                                                  Image.LANCZOS)))
+        for width, variant in targets:
+            variant_path = os.path.join(folder, variant_filename(filename, width))
+            tmp_path = f"{variant_path}.{os.getpid()}.tmp"
+            variant.save(tmp_path, 'WEBP', quality=VARIANT_QUALITY, method=4)
+            os.replace(tmp_path, variant_path)
+    return filename
+
+
+def _log_variant_result(future):
+    if future.exception() is not None:
+        logger.error(f"Image variant generation failed: {future.exception()}")
+
+
+def schedule_variants(path):
+    global _executor, _executor_pid
+    if Image is None or os.path.splitext(path)[1] not in VARIANT_SOURCES:
+        return None
+    # A pool created before gunicorn forked would not work in the worker
+    if _executor is None or _executor_pid != os.getpid():
+        _executor = ProcessPoolExecutor(max_workers=int(os.environ.get('UPLOAD_VARIANT_WORKERS', 2)))
+        _executor_pid = os.getpid()
+    future = _executor.submit(generate_variants, path)
+    future.add_done_callback(_log_variant_result)
+    return future
@@ -0,0 +1,66 @@
+from flask_login import UserMixin
+from sqlalchemy import event
+from database import User
+import os
+import threading
+import time
+
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))  # Seconds
+USER_CACHE_MAX_ENTRIES = int(os.environ.get('USER_CACHE_MAX_ENTRIES', 1000))
+
+
+class CachedUser(UserMixin):
+    # Detached copy of the User fields the views and templates read
+    __slots__ = ('id', 'username', 'email', 'first_name', 'last_name')
+
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.email = user.email
+        self.first_name = user.first_name
+        self.last_name = user.last_name
+
+
+class UserCache:
+    """Per-process TTL cache of logged-in users, keyed by user id.
+
+    Rows changed or deleted through the ORM in this process are evicted at once;
+    other workers pick the change up when their entry expires after ``ttl`` seconds.
+    """
+
+    def __init__(self, ttl=USER_CACHE_TTL, max_entries=USER_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        user, expires_at = entry
+        if expires_at < time.monotonic():
+            self.invalidate(user_id)
+            return None
+        return user
+
+    def put(self, user):
+        cached = CachedUser(user)
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._entries[user.id] = (cached, time.monotonic() + self.ttl)
+        return cached
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def evict_cached_user(mapper, connection, target):
+    user_cache.invalidate(target.id)